@@ -30,15 +30,29 @@ from nya_basic_chat.auth import sign_up_and_in
 from nya_basic_chat.reset_pass import handle_password_recovery
 from nya_basic_chat.feedback import send_graph_email
 from nya_basic_chat.rag.inject import inject
-from nya_basic_chat.rag.cleanup import cleanup_expired_temp_files, clear_user_temp_files
-from nya_basic_chat.rag.processor import get_supabase
+from nya_basic_chat.rag.cleanup import clear_user_temp_files
+from nya_basic_chat.clients import get_supabase
 import uuid
-from nya_basic_chat.rag.processor import ingest_file
+from nya_basic_chat.rag.blobs import get_blob_store
+from nya_basic_chat.rag.jobs import (
+    ACTIVE_STATUSES,
+    dismiss_ingest,
+    enqueue_ingest,
+    ingest_statuses,
+    list_ingest_jobs,
+    retry_ingest,
+    start_workers,
+)
+from nya_basic_chat.rag.sweeper import start_sweeper
+from nya_basic_chat.tracing import span
 
 load_dotenv()
 
 ADMIN_EMAILS = get_secret("ADMIN_EMAILS").split(",")
 
+start_workers()
+start_sweeper()
+
 
 @st.dialog("Submit Feedback or Feature Request")
 def open_feedback_dialog():
@@ -84,6 +98,29 @@ def open_feedback_dialog():
             st.rerun()
 
 
+@st.fragment(run_every="2s")
+def render_ingest_status():
+    # A full rerun hands over the jobs it already listed; the timed reruns poll
+    jobs = st.session_state.pop("ingest_jobs", None)
+    if jobs is None:
+        jobs = list_ingest_jobs(USER_ID)
+    if not jobs:
+        # Everything finished; relist once so new failures show, and stop polling
+        st.session_state.ingest_jobs_stale = True
+        st.rerun()
+
+    st.caption("Processing uploads:")
+    for job in jobs:
+        total = job.get("total_pages") or 0
+        done = job.get("pages_done") or 0
+        if job["status"] == "pending":
+            label = f"{job['file_name']}: queued"
+        else:
+            label = f"{job['file_name']}: page {done} of {total or '?'}"
+            label += f", {job.get('chunks_done') or 0} chunks"
+        st.progress(min(done / total, 1.0) if total else 0.0, text=label)
+
+
 st.set_page_config(page_title="NYA LightChat", page_icon=r"assets/NYA_logo.svg")
 
 handle_password_recovery()
@@ -143,6 +180,10 @@ if "uploader_key" not in st.session_state:
 if "pending_attachments" not in st.session_state:
     st.session_state.pending_attachments = []
 
+# Jobs are listed once per session and again only after this session changes them
+if "ingest_jobs_stale" not in st.session_state:
+    st.session_state.ingest_jobs_stale = True
+
 if "model" not in st.session_state:
     st.session_state.model = prefs.get("model", get_secret("OPENAI_MODEL", "gpt-5-mini"))
 
@@ -215,6 +256,7 @@ with st.sidebar:
         for f in uploaded_files:
             attachment_id = str(uuid.uuid4())
             file_bytes = f.read()
+            content_sha256 = get_blob_store().put(file_bytes)
 
             sb.table("attachments").insert(
                 {
@@ -224,29 +266,43 @@ with st.sidebar:
                     "file_type": f.type,
                     "is_temp": upload_mode == "Temp",
                     "category": category,
+                    "content_sha256": content_sha256,
                 }
             ).execute()
 
-            sb.table("attachment_processing_status").insert(
-                {"attachment_id": attachment_id, "status": "pending"}
-            ).execute()
-
-            ingest_file(
-                {
-                    "id": attachment_id,
-                    "user_id": USER_ID,
-                    "file_name": f.name,
-                    "file_bytes": file_bytes,
-                    "is_temp": upload_mode == "Temp",
-                    "category": category,
-                }
-            )
+            # Ingestion runs on the background worker pool; the sidebar polls its progress
+            enqueue_ingest(attachment_id)
 
             st.session_state.pending_attachments.append(attachment_id)
 
         st.session_state.uploader_key += 1
+        st.session_state.ingest_jobs_stale = True
         st.rerun()
 
+    if st.session_state.ingest_jobs_stale:
+        jobs = list_ingest_jobs(USER_ID, statuses=(*ACTIVE_STATUSES, "error"))
+        active_jobs = [j for j in jobs if j["status"] in ACTIVE_STATUSES]
+        st.session_state.ingest_active = bool(active_jobs)
+        st.session_state.ingest_errors = [j for j in jobs if j["status"] == "error"]
+        st.session_state.ingest_jobs_stale = False
+        if active_jobs:
+            st.session_state.ingest_jobs = active_jobs
+    # Only the status fragment polls, and only while this session has jobs in flight
+    if st.session_state.ingest_active:
+        render_ingest_status()
+
+    for job in st.session_state.ingest_errors:
+        st.caption(f"Processing failed for {job['file_name']}: {job.get('error_message')}")
+        retry_col, dismiss_col = st.columns(2)
+        if retry_col.button("Retry", key=f"retry_{job['attachment_id']}"):
+            retry_ingest(job["attachment_id"])
+            st.session_state.ingest_jobs_stale = True
+            st.rerun()
+        if dismiss_col.button("Dismiss", key=f"dismiss_{job['attachment_id']}"):
+            dismiss_ingest(job["attachment_id"])
+            st.session_state.ingest_jobs_stale = True
+            st.rerun()
+
     if st.session_state.pending_attachments:
         st.caption("Pending attachments (will be added to your next message):")
         for fm in st.session_state.pending_attachments:
@@ -331,64 +387,76 @@ for msg in st.session_state.history:
 # -------- input + response --------
 prompt = st.chat_input("Ask me something…")
 if prompt:
-    cleanup_expired_temp_files(USER_ID)
-    # pull attachments
-    attachments = st.session_state.pending_attachments if attach_to_next else []
-
-    system_prompt, final_user_prompt = inject(
-        system_prompt=st.session_state.system,
-        user_prompt=prompt,
-        user_id=USER_ID,
-        file_ids=attachments,
-    )
-
-    print("Result of inject:", system_prompt, final_user_prompt)
-
-    # build user content
-    user_content = [{"type": "text", "text": final_user_prompt}]
-    # _build_user_content(prompt, attachments=attachments, pdf_mode=pdf_mode)
-
-    # add user message
-    # add user message to history
-    user_msg = {"role": "user", "content": user_content, "attachments": attachments}
-    st.session_state.history.append(user_msg)
-    append_user_message(USER_ID, "user", user_content, [], THREAD_ID)
-
-    with st.chat_message("user"):
-        st.markdown(prompt)
-        for fm in attachments:
-            with st.container(border=True):
-                st.write(f"Attachment ID: {fm}")
-
-    # clear pending after we used them
-    st.session_state.pending_attachments = []
-
-    with st.chat_message("assistant"):
-        call_kwargs = _build_call_kwargs(
-            content=user_content,
-            system=system_prompt,
-            model=st.session_state.model,
-            max_completion_tokens=max_completion_tokens,
-            verbosity=verbosity,
-            reasoning=reasoning_effort,
+    with span("chat.turn", model=st.session_state.model, streaming=streaming):
+        # pull attachments
+        attachments = st.session_state.pending_attachments if attach_to_next else []
+        # Files still being ingested have no vectors yet, so retrieval would silently miss
+        # them; they stay pending for a later message
+        statuses = ingest_statuses(attachments)
+        waiting = [a for a in attachments if statuses.get(a) in ACTIVE_STATUSES]
+        if waiting:
+            st.warning(
+                f"{len(waiting)} attached file(s) are still processing and were not included; "
+                "they will be attached to a later message once ready."
+            )
+        if any(statuses.get(a) == "error" for a in attachments):
+            st.warning("Attached files that failed processing were not included.")
+        attachments = [a for a in attachments if statuses.get(a) == "ready"]
+
+        system_prompt, final_user_prompt = inject(
+            system_prompt=st.session_state.system,
+            user_prompt=prompt,
+            user_id=USER_ID,
+            file_ids=attachments,
         )
-        if streaming:
-            # Stream live text for responsiveness, then re-render with LaTeX once complete
-            ph = st.empty()
-            acc = []
-            for delta in run_stream(**call_kwargs):
-                acc.append(delta)
-                ph.markdown("".join(acc))  # quick live preview (plain markdown)
-            answer = "".join(acc)
-            ph.empty()
-            render_message_with_latex(answer)  # pretty render with LaTeX
-        else:
-            answer = run_once(**call_kwargs)
-            render_message_with_latex(answer)
 
-    # persist to disk
-    answer_parts = [{"category": "response", "type": "text", "text": answer}]
-    st.session_state.history.append(
-        {"role": "assistant", "content": answer_parts, "attachments": []}
-    )
-    append_user_message(USER_ID, "assistant", answer_parts, [], thread_id=THREAD_ID)
+        print("Result of inject:", system_prompt, final_user_prompt)
+
+        # build user content
+        user_content = [{"type": "text", "text": final_user_prompt}]
+        # _build_user_content(prompt, attachments=attachments, pdf_mode=pdf_mode)
+
+        # add user message
+        # add user message to history
+        user_msg = {"role": "user", "content": user_content, "attachments": attachments}
+        st.session_state.history.append(user_msg)
+        append_user_message(USER_ID, "user", user_content, [], THREAD_ID)
+
+        with st.chat_message("user"):
+            st.markdown(prompt)
+            for fm in attachments:
+                with st.container(border=True):
+                    st.write(f"Attachment ID: {fm}")
+
+        # clear pending after we used them
+        st.session_state.pending_attachments = waiting
+
+        with st.chat_message("assistant"):
+            call_kwargs = _build_call_kwargs(
+                content=user_content,
+                system=system_prompt,
+                model=st.session_state.model,
+                max_completion_tokens=max_completion_tokens,
+                verbosity=verbosity,
+                reasoning=reasoning_effort,
+            )
+            if streaming:
+                # Stream live text for responsiveness, then re-render with LaTeX once complete
+                ph = st.empty()
+                acc = []
+                for delta in run_stream(**call_kwargs):
+                    acc.append(delta)
+                    ph.markdown("".join(acc))  # quick live preview (plain markdown)
+                answer = "".join(acc)
+                ph.empty()
+                render_message_with_latex(answer)  # pretty render with LaTeX
+            else:
+                answer = run_once(**call_kwargs)
+                render_message_with_latex(answer)
+
+        # persist to disk
+        answer_parts = [{"category": "response", "type": "text", "text": answer}]
+        st.session_state.history.append(
+            {"role": "assistant", "content": answer_parts, "attachments": []}
+        )
+        append_user_message(USER_ID, "assistant", answer_parts, [], thread_id=THREAD_ID)
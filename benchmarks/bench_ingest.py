@@ -0,0 +1,237 @@
+"""
+End-to-end ingestion benchmark, fully offline.
+
+Builds a synthetic multi-page PDF with code-style section numbering and runs
+`ingest_file` against in-process fakes of OpenAI, Pinecone and Supabase with
+injected latency. Reports pages/sec, chunks/sec, peak RSS, request counts and
+per-stage time.
+
+    poetry run python benchmarks/bench_ingest.py --pages 200 --embed-latency 0.3
+
+Token counts come from tiktoken's cl100k_base file when it is cached locally (run
+once online, or point TIKTOKEN_CACHE_DIR at a copy). Without it, an approximate
+local tokenizer is used and a notice is printed, so chunk counts differ slightly.
+"""
+
+# ruff: noqa: E402
+import argparse
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+import fitz
+
+from fakes import FakeEncoding, FakeIndex, FakeOpenAI, FakeSupabase, Latency
+
+WORDS = (
+    "structure shall design load seismic wind member connection provided accordance "
+    "requirements building floor roof wall foundation concrete steel masonry wood "
+    "minimum maximum factored nominal strength deflection anchorage diaphragm"
+).split()
+
+
+def make_pdf(pages, words_per_page, seed=0):
+    """Return PDF bytes whose pages read like a building code chapter."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    chapter = 16
+    for p in range(pages):
+        lines = []
+        n = 0
+        section = 1
+        while n < words_per_page:
+            heading = f"{chapter}{p % 100:02d}.{section}.{rng.randint(1, 9)}"
+            body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 60)))
+            ref = f"{chapter}{rng.randint(0, 99):02d}.{rng.randint(1, 9)}"
+            lines.append(f"{heading} {body.capitalize()}. See Section {ref}.")
+            n += len(body.split()) + 4
+            section += 1
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), "\n".join(lines), fontsize=6)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _peak_rss_mb():
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return self_kb / 1024, children_kb / 1024
+
+
+def _install_encoding():
+    """Use tiktoken's cached cl100k_base if there is one, else the local stand-in."""
+    from nya_basic_chat.rag import context, embedder, processor
+
+    try:
+        embedder.get_encoding()
+        return
+    except Exception as e:
+        # tiktoken downloads the file on first use; offline that is a connection error
+        print(
+            f"tiktoken's cl100k_base is not cached ({type(e).__name__}); token counts are "
+            "approximated by a local tokenizer. Cache it or set TIKTOKEN_CACHE_DIR for exact ones."
+        )
+    encoding = FakeEncoding()
+    for module in (embedder, processor, context):
+        module.get_encoding = lambda *args, **kwargs: encoding
+
+
+def install_fakes(args, workdir, embedder=None):
+    """Point the ingestion modules at the fakes and at throwaway caches."""
+    from nya_basic_chat.rag import cache, classify, processor, sections
+    from nya_basic_chat.rag.vectorstore import LocalVectorStore, PineconeVectorStore
+
+    _install_encoding()
+
+    embed_latency = Latency(args.embed_latency, args.embed_item_latency)
+    llm_latency = Latency(args.llm_latency)
+    db_latency = Latency(args.db_latency)
+    index_latency = Latency(args.index_latency)
+
+    openai = FakeOpenAI(embed_latency, llm_latency, dim=args.dim, embedder=embedder)
+    sb = FakeSupabase(db_latency)
+    if args.vector_store == "local":
+        store = LocalVectorStore(root=workdir / "vectors")
+    else:
+        store = PineconeVectorStore(FakeIndex(index_latency))
+
+    processor.get_supabase = lambda: sb
+    processor.get_vector_store = lambda: store
+    processor.get_openai = openai
+    sections.get_openai = openai
+    classify.get_openai = openai
+
+    cache_file = workdir / "cache.sqlite3"
+    cache._embedding_cache = cache.EmbeddingCache(path=cache_file)
+    sections._fallback_cache = cache.JsonCache("sections", path=cache_file)
+    classify._doc_type_cache = cache.JsonCache("doc_type", path=cache_file)
+
+    latencies = {
+        "openai.embeddings": embed_latency,
+        "openai.chat": llm_latency,
+        "supabase": db_latency,
+        "pinecone": index_latency,
+    }
+    return sb, store, latencies
+
+
+def run_once(file_bytes, sb):
+    from nya_basic_chat.rag import processor
+
+    attachment_id = str(uuid.uuid4())
+    row = {
+        "id": attachment_id,
+        "user_id": "bench-user",
+        "file_name": "bench.pdf",
+        "category": "personal_perm",
+        "is_temp": False,
+    }
+    sb.table("attachments").insert(row).execute()
+    sb.table("attachment_processing_status").insert(
+        {"attachment_id": attachment_id, "status": "processing"}
+    ).execute()
+
+    stats = {}
+    started = time.perf_counter()
+    processor.ingest_file({**row, "file_bytes": file_bytes}, dedup=False, stats=stats)
+    elapsed = time.perf_counter() - started
+
+    status = (
+        sb.table("attachment_processing_status")
+        .select("*")
+        .eq("attachment_id", attachment_id)
+        .single()
+        .execute()
+        .data
+    )
+    return elapsed, status, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--words-per-page", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=1, help="runs; later ones hit the caches")
+    parser.add_argument("--dim", type=int, default=1536, help="fake embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.2, help="s per embeddings call")
+    parser.add_argument("--embed-item-latency", type=float, default=0.0, help="s per input")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="s per chat call")
+    parser.add_argument("--db-latency", type=float, default=0.03, help="s per Supabase call")
+    parser.add_argument("--index-latency", type=float, default=0.05, help="s per Pinecone call")
+    parser.add_argument(
+        "--vector-store",
+        choices=("pinecone", "local"),
+        default="pinecone",
+        help="fake Pinecone index with --index-latency, or the local memory-mapped store",
+    )
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sb, _, latencies = install_fakes(args, Path(tmp))
+
+        t = time.perf_counter()
+        file_bytes = make_pdf(args.pages, args.words_per_page)
+        gen_time = time.perf_counter() - t
+        rss_before, _ = _peak_rss_mb()
+        print(
+            f"Generated {args.pages}-page PDF ({len(file_bytes) / 1e6:.1f} MB) in {gen_time:.1f}s"
+        )
+
+        runs = []
+        for i in range(args.repeat):
+            for lat in latencies.values():
+                lat.calls.clear()
+            elapsed, status, stats = run_once(file_bytes, sb)
+            rss_self, rss_children = _peak_rss_mb()
+            chunks = status.get("chunks_done") or 0
+            run = {
+                "run": i + 1,
+                "seconds": elapsed,
+                "pages": args.pages,
+                "chunks": chunks,
+                "pages_per_sec": args.pages / elapsed,
+                "chunks_per_sec": chunks / elapsed,
+                "peak_rss_mb": rss_self,
+                "peak_rss_before_ingest_mb": rss_before,
+                "peak_rss_workers_mb": rss_children,
+                "requests": {name: dict(lat.calls) for name, lat in latencies.items() if lat.calls},
+                "stages": stats,
+            }
+            runs.append(run)
+            _print_run(run)
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "runs": runs}, indent=2, default=str))
+
+
+def _print_run(run):
+    print(
+        f"\nRun {run['run']}: {run['seconds']:.2f}s, {run['pages_per_sec']:.1f} pages/s, "
+        f"{run['chunks_per_sec']:.1f} chunks/s ({run['chunks']} chunks)"
+    )
+    print(
+        f"  peak RSS {run['peak_rss_mb']:.0f} MB "
+        f"(before ingest {run['peak_rss_before_ingest_mb']:.0f} MB, "
+        f"extract workers {run['peak_rss_workers_mb']:.0f} MB)"
+    )
+    print(f"  {'stage':<10}{'wall s':>9}{'busy s':>9}{'blocked s':>11}{'items out':>11}")
+    for name, s in run["stages"].items():
+        print(
+            f"  {name:<10}{s['wall']:>9.2f}{s['busy']:>9.2f}{s['wait']:>11.2f}{s['items_out']:>11}"
+        )
+    for backend, calls in run["requests"].items():
+        print(f"  {backend}: " + ", ".join(f"{k}={v}" for k, v in sorted(calls.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+Retrieval quality and latency evaluation, fully offline.
+
+Ingests a fixed corpus into the local vector store through `ingest_file`, asks
+every question of a labelled set through the same path as `retrieve_chunks`,
+and reports recall@k, MRR, injected context tokens and per-query latency
+percentiles. Give `--config` more than once to compare settings side by side:
+
+    poetry run python benchmarks/eval_retrieval.py \\
+        --config base --config lean:chunk_size=800,chunk_overlap=150,top_k=4
+
+Each question lists evidence passages. An excerpt counts as relevant when it
+contains one of them, so labels stay valid whatever the chunking. The bundled
+corpus under eval_data/ is illustrative text written in the style of a
+building code, not actual code provisions.
+
+The default lexical embedder (hashed bag of words) needs no network and is
+meant for comparing settings; its scores are not on the scale CONTEXT_MIN_SCORE
+is tuned for, so min_score defaults to 0 with it. `--embedder openai` uses the
+production embedding model, caching vectors on disk so reruns are offline.
+"""
+
+# ruff: noqa: E402
+import argparse
+import functools
+import hashlib
+import json
+import math
+import re
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+import fitz
+
+from bench_ingest import install_fakes, make_pdf
+
+DATA_DIR = Path(__file__).resolve().parent / "eval_data"
+EVAL_USER = "eval-user"
+EMBED_CACHE = ROOT / ".eval_embeddings.sqlite3"
+
+# Settings a configuration may override, with how to parse them
+CONFIG_KEYS = {
+    "chunk_size": int,
+    "chunk_overlap": int,
+    "top_k": int,
+    "max_tokens": int,
+    "min_score": float,
+    "relative_cutoff": float,
+    "expand_references": lambda v: v.lower() in ("1", "true", "yes", "on"),
+}
+
+# Words too common in code text to say anything about relevance
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its may must not of on or shall "
+    "such than that the their then there these this to used what when where which with".split()
+)
+
+
+# ---------- embedders ----------
+
+
+class LexicalEmbedder:
+    """Hashed unigrams and bigrams with sublinear term frequency, L2-normalized."""
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def _slot(self, feature):
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest())
+        return h % self.dim, 1.0 if h >> 63 else -1.0
+
+    def __call__(self, text):
+        words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS]
+        counts = {}
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+
+        v = [0.0] * self.dim
+        for feature, n in counts.items():
+            slot, sign = self._slot(feature)
+            v[slot] += sign * (1 + math.log(n))
+        norm = math.sqrt(sum(x * x for x in v)) or 1.0
+        return [x / norm for x in v]
+
+
+class OpenAIEmbedder:
+    """The production embedding model, one text per call, cached on disk."""
+
+    def __init__(self, path=EMBED_CACHE):
+        from nya_basic_chat.clients import get_openai
+        from nya_basic_chat.rag.cache import EmbeddingCache
+        from nya_basic_chat.rag.retriever import QUERY_EMBED_MODEL
+
+        self.client = get_openai()
+        self.model = QUERY_EMBED_MODEL
+        self.cache = EmbeddingCache(path=path)
+
+    def __call__(self, text):
+        (vector,) = self.cache.get_many(self.model, [text])
+        if vector is None:
+            response = self.client.embeddings.create(model=self.model, input=[text])
+            vector = response.data[0].embedding
+            self.cache.put_many(self.model, [text], [vector])
+        return vector
+
+
+# ---------- corpus and questions ----------
+
+
+def text_to_pdf(text, words_per_page=350):
+    """Lay plain text out as PDF pages, one paragraph per line as the extractor expects."""
+    doc = fitz.open()
+    page_lines, words = [], 0
+
+    def flush():
+        page = doc.new_page()
+        rect = page.rect + (36, 36, -36, -36)
+        if page.insert_textbox(rect, "\n".join(page_lines), fontsize=8) < 0:
+            raise ValueError("text does not fit on one page; lower words_per_page")
+
+    for line in text.splitlines():
+        if page_lines and words + len(line.split()) > words_per_page:
+            flush()
+            page_lines, words = [], 0
+        page_lines.append(line)
+        words += len(line.split())
+    if page_lines:
+        flush()
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def load_corpus(directory, filler_pages=0):
+    """Return `[(file_name, pdf_bytes)]` for the .pdf and .txt files in `directory`."""
+    files = []
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix == ".pdf":
+            files.append((path.name, path.read_bytes()))
+        elif path.suffix == ".txt":
+            files.append((path.with_suffix(".pdf").name, text_to_pdf(path.read_text())))
+    if filler_pages:
+        # Code-like pages that share the corpus vocabulary but answer no question
+        files.append(("filler.pdf", make_pdf(filler_pages, 500, seed=1)))
+    return files
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _normalize(text):
+    return " ".join(text.split()).casefold()
+
+
+# ---------- configurations ----------
+
+
+def parse_config(spec):
+    """Parse `name[:key=value,...]` into `(name, overrides)`."""
+    name, _, rest = spec.partition(":")
+    overrides = {}
+    for item in filter(None, rest.split(",")):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key not in CONFIG_KEYS:
+            raise argparse.ArgumentTypeError(
+                f"unknown setting {key!r}; choose from {', '.join(CONFIG_KEYS)}"
+            )
+        overrides[key] = CONFIG_KEYS[key](value.strip())
+    return name or "default", overrides
+
+
+def resolve_config(overrides, embedder):
+    """Fill in the repo defaults for every setting the configuration leaves out."""
+    from nya_basic_chat.rag import context, processor
+
+    settings = {
+        "chunk_size": processor.CHUNK_SIZE,
+        "chunk_overlap": processor.CHUNK_OVERLAP,
+        "top_k": 8,
+        "max_tokens": context.CONTEXT_MAX_TOKENS,
+        "min_score": context.CONTEXT_MIN_SCORE if embedder == "openai" else 0.0,
+        "relative_cutoff": context.CONTEXT_RELATIVE_CUTOFF,
+        "expand_references": True,
+    }
+    settings.update(overrides)
+    return settings
+
+
+def _reset_retrieval_caches():
+    from nya_basic_chat.rag import cache, chunk_store, retriever, section_index
+
+    cache._shared_versions.clear()
+    retriever._query_embeddings.clear()
+    retriever._query_results.clear()
+    section_index._memo.clear()
+    chunk_store._cache = chunk_store.ChunkCache()
+
+
+# ---------- evaluation ----------
+
+
+def ingest_corpus(sb, files, settings):
+    from nya_basic_chat.rag import processor
+
+    chunk_pages = processor._chunk_pages
+    processor._chunk_pages = functools.partial(
+        chunk_pages, chunk_size=settings["chunk_size"], overlap=settings["chunk_overlap"]
+    )
+    try:
+        for file_name, data in files:
+            row = {
+                "id": str(uuid.uuid4()),
+                "user_id": EVAL_USER,
+                "file_name": file_name,
+                "category": "global_perm",
+                "is_temp": False,
+            }
+            sb.table("attachments").insert(row).execute()
+            sb.table("attachment_processing_status").insert(
+                {"attachment_id": row["id"], "status": "processing"}
+            ).execute()
+            processor.ingest_file({**row, "file_bytes": data}, dedup=False)
+    finally:
+        processor._chunk_pages = chunk_pages
+    return len(sb.tables.get("chunks", {}))
+
+
+def score_question(question, excerpts):
+    """Rank (1-based) of the first excerpt holding each evidence passage, or None."""
+    contents = [_normalize(e.content) for e in excerpts]
+    ranks = []
+    for evidence in question["evidence"]:
+        needle = _normalize(evidence)
+        ranks.append(next((i + 1 for i, c in enumerate(contents) if needle in c), None))
+    return ranks
+
+
+def run_questions(questions, settings):
+    from nya_basic_chat.rag import context, retriever
+
+    assemble = retriever.assemble_context
+    retriever.assemble_context = functools.partial(
+        assemble, min_score=settings["min_score"], relative_cutoff=settings["relative_cutoff"]
+    )
+    results = []
+    try:
+        for q in questions:
+            started = time.perf_counter()
+            excerpts = retriever.retrieve_context(
+                EVAL_USER,
+                [],
+                q["question"],
+                top_k=settings["top_k"],
+                max_tokens=settings["max_tokens"],
+                expand_references=settings["expand_references"],
+            )
+            injected = context.format_context(excerpts)
+            elapsed = time.perf_counter() - started
+            results.append(
+                {
+                    "id": q.get("id"),
+                    "ranks": score_question(q, excerpts),
+                    "excerpts": len(excerpts),
+                    "tokens": context.count_tokens(injected) if injected else 0,
+                    "latency_ms": elapsed * 1000,
+                }
+            )
+    finally:
+        retriever.assemble_context = assemble
+    return results
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(results, ks):
+    """Aggregate per-question results into the reported metrics."""
+    n = len(results)
+    summary = {}
+    for k in ks:
+        summary[f"recall@{k}"] = (
+            sum(
+                sum(r is not None and r <= k for r in q["ranks"]) / len(q["ranks"]) for q in results
+            )
+            / n
+        )
+    summary["recall@all"] = (
+        sum(sum(r is not None for r in q["ranks"]) / len(q["ranks"]) for q in results) / n
+    )
+    summary["mrr"] = (
+        sum(1 / min(r for r in q["ranks"] if r) if any(q["ranks"]) else 0 for q in results) / n
+    )
+    tokens = [q["tokens"] for q in results]
+    latencies = [q["latency_ms"] for q in results]
+    summary.update(
+        {
+            "excerpts_mean": sum(q["excerpts"] for q in results) / n,
+            "tokens_mean": sum(tokens) / n,
+            "tokens_p95": _percentile(tokens, 95),
+            "latency_p50_ms": _percentile(latencies, 50),
+            "latency_p95_ms": _percentile(latencies, 95),
+            "latency_p99_ms": _percentile(latencies, 99),
+        }
+    )
+    return summary
+
+
+def evaluate(args, files, questions, name, overrides):
+    settings = resolve_config(overrides, args.embedder)
+    embedder = OpenAIEmbedder() if args.embedder == "openai" else LexicalEmbedder(args.dim)
+
+    # Ingestion runs without simulated latency; the fake index is unused with the local store
+    fake_args = argparse.Namespace(
+        **{**vars(args), "embed_latency": 0.0, "db_latency": 0.0},
+        embed_item_latency=0.0,
+        llm_latency=0.0,
+        index_latency=0.0,
+        vector_store="local",
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        sb, store, latencies = install_fakes(fake_args, Path(tmp), embedder=embedder)
+
+        from nya_basic_chat.rag import processor, retriever
+
+        retriever.get_supabase = lambda: sb
+        retriever.get_vector_store = lambda: store
+        retriever.get_openai = processor.get_openai
+        _reset_retrieval_caches()
+
+        chunks = ingest_corpus(sb, files, settings)
+
+        latencies["openai.embeddings"].per_call = args.embed_latency
+        latencies["supabase"].per_call = args.db_latency
+        for lat in latencies.values():
+            lat.calls.clear()
+        results = run_questions(questions, settings)
+
+    return {
+        "name": name,
+        "settings": settings,
+        "chunks": chunks,
+        "summary": summarize(results, args.k),
+        "questions": results,
+    }
+
+
+def _print_report(runs, ks):
+    names = [run["name"] for run in runs]
+    width = max(12, *(len(n) for n in names))
+    rows = [f"recall@{k}" for k in ks] + [
+        "recall@all",
+        "mrr",
+        "excerpts_mean",
+        "tokens_mean",
+        "tokens_p95",
+        "latency_p50_ms",
+        "latency_p95_ms",
+        "latency_p99_ms",
+    ]
+
+    print()
+    for run in runs:
+        settings = ", ".join(f"{k}={v}" for k, v in run["settings"].items())
+        print(f"{run['name']}: {run['chunks']} chunks; {settings}")
+    print()
+    header = f"{'metric':<16}" + "".join(f"{n:>{width + 2}}" for n in names)
+    if len(runs) > 1:
+        header += "".join(f"{'vs ' + names[0]:>{width + 6}}" for _ in names[1:])
+    print(header)
+    for row in rows:
+        values = [run["summary"][row] for run in runs]
+        line = f"{row:<16}" + "".join(f"{v:>{width + 2}.3f}" for v in values)
+        line += "".join(f"{v - values[0]:>+{width + 6}.3f}" for v in values[1:])
+        print(line)
+
+    # Questions whose evidence some configuration found and another missed
+    if len(runs) > 1:
+        diffs = []
+        for i, q in enumerate(runs[0]["questions"]):
+            found = [all(r is not None for r in run["questions"][i]["ranks"]) for run in runs]
+            if len(set(found)) > 1:
+                diffs.append((q["id"], found))
+        if diffs:
+            print("\nQuestions answered by only some configurations:")
+            for qid, found in diffs:
+                marks = ", ".join(f"{n}={'yes' if f else 'no'}" for n, f in zip(names, found))
+                print(f"  {qid}: {marks}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", type=Path, default=DATA_DIR / "corpus")
+    parser.add_argument("--questions", type=Path, default=DATA_DIR / "questions.jsonl")
+    parser.add_argument(
+        "--config",
+        action="append",
+        type=parse_config,
+        help="name[:key=value,...] with keys " + ", ".join(CONFIG_KEYS) + "; repeat to compare",
+    )
+    parser.add_argument("--embedder", choices=("lexical", "openai"), default="lexical")
+    parser.add_argument("--dim", type=int, default=1024, help="lexical embedding dimension")
+    parser.add_argument(
+        "--filler-pages", type=int, default=40, help="generated distractor pages added to corpus"
+    )
+    parser.add_argument(
+        "--k", type=lambda s: [int(k) for k in s.split(",")], default=[1, 3, 5], help="e.g. 1,3,5"
+    )
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="s per embeddings call")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="s per Supabase call")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    files = load_corpus(args.corpus, args.filler_pages)
+    questions = load_questions(args.questions)
+    print(f"{len(files)} documents, {len(questions)} questions, {args.embedder} embedder")
+
+    runs = []
+    for name, overrides in args.config or [("default", {})]:
+        runs.append(evaluate(args, files, questions, name, overrides))
+    _print_report(runs, args.k)
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "runs": runs}, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
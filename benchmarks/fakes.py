@@ -0,0 +1,317 @@
+"""In-process stand-ins for OpenAI, Pinecone and Supabase used by the benchmarks."""
+
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+PRIMARY_KEYS = {
+    "attachment_processing_status": ("attachment_id",),
+    "section_index": ("section", "chunk_id"),
+    "namespace_versions": ("namespace",),
+    "orphan_blobs": ("content_sha256",),
+}
+
+
+class Latency:
+    """Fixed delay per call plus an optional per-item delay, with call counting."""
+
+    def __init__(self, per_call=0.0, per_item=0.0):
+        self.per_call = per_call
+        self.per_item = per_item
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def wait(self, kind, items=1):
+        with self.lock:
+            self.calls[kind] += 1
+        delay = self.per_call + self.per_item * items
+        if delay:
+            time.sleep(delay)
+
+
+# ---------- tiktoken ----------
+
+
+class FakeEncoding:
+    """
+    Approximate stand-in for cl100k_base when its file is not cached locally.
+
+    Splits text into words, punctuation runs and whitespace, each with at most one
+    leading space, as tiktoken's pre-tokenizer does, and treats each piece as a
+    token. Counts run somewhat below the real encoding's; decoding the pieces gives
+    back the exact text.
+    """
+
+    _PIECES = re.compile(r"\s?\w+|\s?[^\w\s]+|\s+")
+
+    def encode(self, text, disallowed_special=()):
+        return self._PIECES.findall(text)
+
+    def encode_batch(self, texts, disallowed_special=()):
+        return [self.encode(t) for t in texts]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+# ---------- OpenAI ----------
+
+
+def fake_embedding(text, dim):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    rng = random.Random(seed)
+    v = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(x * x for x in v)) or 1.0
+    return [x / norm for x in v]
+
+
+class FakeOpenAI:
+    """Deterministic embeddings and canned structured-output chat completions."""
+
+    def __init__(self, embed_latency, llm_latency, dim=1536, embedder=None):
+        self.embed_latency = embed_latency
+        self.llm_latency = llm_latency
+        self.dim = dim
+        self.embedder = embedder or (lambda text: fake_embedding(text, dim))
+        self.embeddings = SimpleNamespace(create=self._embed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+
+    def __call__(self, *args, **kwargs):
+        # Lets the instance stand in for client factories such as get_openai()
+        return self
+
+    def _embed(self, model, input):
+        self.embed_latency.wait("embeddings.create", len(input))
+        data = [SimpleNamespace(index=i, embedding=self.embedder(t)) for i, t in enumerate(input)]
+        return SimpleNamespace(data=data)
+
+    def _complete(self, model, messages, response_format=None, **kwargs):
+        self.llm_latency.wait("chat.completions.create")
+        name = (response_format or {}).get("json_schema", {}).get("name")
+        prompt = messages[-1]["content"]
+        if name == "doc_type_result":
+            content = {"doc_type": "building_code", "requires_section_parsing": True}
+        elif name == "doc_sections_batch":
+            n = len(re.findall(r"--- Chunk \d+ ---", prompt))
+            content = {
+                "results": [
+                    {"chunk": i, "main_sections": [], "reference_sections": []} for i in range(n)
+                ]
+            }
+        else:
+            content = {}
+        message = SimpleNamespace(content=json.dumps(content))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+# ---------- Pinecone ----------
+
+
+def _match_filter(metadata, flt):
+    for key, cond in (flt or {}).items():
+        if key == "$or":
+            if not any(_match_filter(metadata, sub) for sub in cond):
+                return False
+            continue
+        if key == "$and":
+            if not all(_match_filter(metadata, sub) for sub in cond):
+                return False
+            continue
+        value = metadata.get(key)
+        if isinstance(cond, dict):
+            for op, arg in cond.items():
+                if op == "$eq" and value != arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$in" and not (
+                    value in arg or (isinstance(value, list) and set(value) & set(arg))
+                ):
+                    return False
+                if op == "$nin" and value in arg:
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+
+class FakeIndex:
+    """Dict-backed vector index with the subset of the Pinecone Index API the app uses."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.namespaces = {}
+        self.lock = threading.Lock()
+
+    def upsert(self, vectors, namespace=""):
+        self.latency.wait("upsert", len(vectors))
+        with self.lock:
+            ns = self.namespaces.setdefault(namespace, {})
+            for v in vectors:
+                ns[v["id"]] = (list(v["values"]), dict(v.get("metadata") or {}))
+
+    def fetch(self, ids, namespace=""):
+        self.latency.wait("fetch", len(ids))
+        ns = self.namespaces.get(namespace, {})
+        vectors = {
+            i: SimpleNamespace(id=i, values=ns[i][0], metadata=ns[i][1]) for i in ids if i in ns
+        }
+        return SimpleNamespace(vectors=vectors)
+
+    def delete(self, ids, namespace=""):
+        self.latency.wait("delete", len(ids))
+        with self.lock:
+            ns = self.namespaces.get(namespace, {})
+            for i in ids:
+                ns.pop(i, None)
+
+    def query(self, vector, namespace="", filter=None, top_k=10, include_metadata=False, **kw):
+        self.latency.wait("query")
+        scored = []
+        for i, (values, metadata) in self.namespaces.get(namespace, {}).items():
+            if _match_filter(metadata, filter):
+                scored.append((sum(a * b for a, b in zip(vector, values)), i, metadata))
+        scored.sort(key=lambda s: -s[0])
+        matches = [
+            SimpleNamespace(id=i, score=score, metadata=metadata if include_metadata else None)
+            for score, i, metadata in scored[:top_k]
+        ]
+        return SimpleNamespace(matches=matches)
+
+
+# ---------- Supabase ----------
+
+
+class _Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.payload = None
+        self.filters = []
+        self.order_by = None
+        self.bounds = None
+        self.single_row = False
+
+    def select(self, columns="*"):
+        self.op = "select"
+        self.columns = [c.strip() for c in columns.split(",")] if columns != "*" else None
+        return self
+
+    def insert(self, rows):
+        self.op, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows):
+        self.op, self.payload = "upsert", rows
+        return self
+
+    def update(self, values):
+        self.op, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def _where(self, fn):
+        self.filters.append(fn)
+        return self
+
+    def eq(self, col, value):
+        return self._where(lambda r: r.get(col) == value)
+
+    def neq(self, col, value):
+        return self._where(lambda r: r.get(col) != value)
+
+    def in_(self, col, values):
+        values = set(values)
+        return self._where(lambda r: r.get(col) in values)
+
+    def lt(self, col, value):
+        return self._where(lambda r: r.get(col) is not None and r.get(col) < value)
+
+    def gt(self, col, value):
+        return self._where(lambda r: r.get(col) is not None and r.get(col) > value)
+
+    def overlaps(self, col, values):
+        values = set(values)
+        return self._where(lambda r: bool(set(r.get(col) or []) & values))
+
+    def order(self, col, desc=False):
+        self.order_by = (col, desc)
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end + 1)
+        return self
+
+    def limit(self, n):
+        self.bounds = (0, n)
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def execute(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        self.db.latency.wait(f"{self.table}.{self.op}", len(rows) if self.payload else 1)
+        with self.db.lock:
+            data = self._apply()
+        if self.single_row:
+            data = data[0] if data else None
+        return SimpleNamespace(data=data)
+
+    def _apply(self):
+        table = self.db.tables.setdefault(self.table, {})
+        pk = PRIMARY_KEYS.get(self.table, ("id",))
+
+        def key(r):
+            return tuple(r[c] for c in pk)
+
+        matching = [r for r in table.values() if all(f(r) for f in self.filters)]
+
+        if self.op in ("insert", "upsert"):
+            rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            for r in rows:
+                if self.op == "upsert" and key(r) in table:
+                    table[key(r)].update(r)
+                else:
+                    table[key(r)] = dict(r)
+            return [dict(table[key(r)]) for r in rows]
+        if self.op == "update":
+            for r in matching:
+                r.update(self.payload)
+            return [dict(r) for r in matching]
+        if self.op == "delete":
+            for r in matching:
+                table.pop(key(r), None)
+            return [dict(r) for r in matching]
+
+        if self.order_by:
+            col, desc = self.order_by
+            matching.sort(key=lambda r: r.get(col), reverse=desc)
+        if self.bounds:
+            matching = matching[self.bounds[0] : self.bounds[1]]
+        if getattr(self, "columns", None):
+            return [{c: r.get(c) for c in self.columns} for r in matching]
+        return [dict(r) for r in matching]
+
+
+class FakeSupabase:
+    """In-memory tables behind the supabase-py query builder calls the app makes."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return _Query(self, name)
@@ -0,0 +1,83 @@
+# Location: src/nya_basic_chat/clients.py
+import threading
+import httpx
+import openai
+from pinecone import Pinecone
+from supabase import ClientOptions, create_client
+from nya_basic_chat.config import get_secret
+
+# Connections kept open per client; covers the ingest workers plus concurrent chat turns
+DEFAULT_POOL_SIZE = 20
+# Idle keep-alive connections are closed after this many seconds
+KEEPALIVE_EXPIRY = 60
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _pool_size():
+    return int(get_secret("CLIENT_POOL_SIZE", DEFAULT_POOL_SIZE))
+
+
+def _limits():
+    size = _pool_size()
+    return httpx.Limits(
+        max_connections=size,
+        max_keepalive_connections=size,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _shared(key, factory):
+    """Return the client stored under `key`, creating it on first use."""
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+        return client
+
+
+def get_openai(api_key=None, base_url=None) -> openai.OpenAI:
+    """Process-wide OpenAI client per key and base URL, on a keep-alive connection pool."""
+    api_key = api_key or get_secret("OPENAI_API_KEY")
+
+    def make():
+        kwargs = {"api_key": api_key, "http_client": openai.DefaultHttpxClient(limits=_limits())}
+        if base_url:
+            kwargs["base_url"] = base_url
+        return openai.OpenAI(**kwargs)
+
+    return _shared(("openai", api_key, base_url), make)
+
+
+def get_supabase():
+    """Process-wide Supabase client with the service role key."""
+
+    def make():
+        url = get_secret("SUPABASE_URL")
+        key = get_secret("SUPABASE_SERVICE_ROLE_KEY")
+        http_client = httpx.Client(limits=_limits(), timeout=120, follow_redirects=True)
+        try:
+            options = ClientOptions(httpx_client=http_client)
+        except TypeError:
+            # supabase-py releases without `httpx_client` keep their own default pool
+            http_client.close()
+            options = ClientOptions()
+        return create_client(url, key, options=options)
+
+    return _shared(("supabase",), make)
+
+
+def get_pinecone_index():
+    """Process-wide handle on the Pinecone index, with a pool sized for concurrent upserts."""
+
+    def make():
+        pc = Pinecone(api_key=get_secret("PINECONE_API_KEY"))
+        size = _pool_size()
+        return pc.Index(
+            get_secret("PINECONE_INDEX_NAME"),
+            pool_threads=size,
+            connection_pool_maxsize=size,
+        )
+
+    return _shared(("pinecone",), make)
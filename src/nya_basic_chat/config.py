@@ -7,6 +7,9 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[2]
 HISTORY_FILE = ROOT / ".chat_history.json"
 PREFS_FILE = ROOT / ".chat_prefs.json"
+EMBED_CACHE_FILE = ROOT / ".embedding_cache.sqlite3"
+VECTOR_STORE_DIR = ROOT / ".vector_store"
+TRACE_FILE = ROOT / ".traces.jsonl"
 UPLOAD_DIR = ROOT / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 
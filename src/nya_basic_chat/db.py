@@ -1,6 +1,7 @@
 # src/nya_basic_chat/db.py
 from typing import List, Dict, Any
 from nya_basic_chat.auth import _sb
+from nya_basic_chat.tracing import traced
 
 
 def _authed_client():
@@ -15,6 +16,7 @@ def _authed_client():
     return client
 
 
+@traced("db.load_messages")
 def load_messages(user_id: str, thread_id: str = "default") -> List[Dict[str, Any]]:
     """Return messages sorted oldest to newest."""
     sb = _authed_client()
@@ -36,6 +38,7 @@ def load_messages(user_id: str, thread_id: str = "default") -> List[Dict[str, An
     return out
 
 
+@traced("db.append_message")
 def append_message(
     user_id: str, role: str, content: Any, attachments: Any = None, thread_id: str = "default"
 ):
@@ -50,6 +53,7 @@ def append_message(
     sb.table("messages").insert(payload).execute()
 
 
+@traced("db.clear_thread")
 def clear_thread(user_id: str, thread_id: str = "default"):
     sb = _authed_client()
     sb.table("messages").delete().eq("user_id", user_id).eq("thread_id", thread_id).execute()
@@ -3,11 +3,14 @@
 from __future__ import annotations
 import os
 import json
+import time
 from typing import Optional, Dict, Any, Sequence, List
 from dataclasses import dataclass
 from dotenv import load_dotenv
 from openai import OpenAI
+from nya_basic_chat.clients import get_openai
 from nya_basic_chat.helpers import _format_history
+from nya_basic_chat.tracing import span
 from nya_basic_chat.web import fetch_url, tavily_search
 import streamlit as st
 import logging
@@ -52,10 +55,7 @@ def _cfg() -> LLMConfig:
 
 def _client() -> OpenAI:
     cfg = _cfg()
-    kwargs = {"api_key": cfg.api_key}
-    if cfg.base_url:
-        kwargs["base_url"] = cfg.base_url
-    return OpenAI(**kwargs)
+    return get_openai(cfg.api_key, cfg.base_url)
 
 
 def _tool_defs() -> List[Dict[str, Any]]:
@@ -95,16 +95,17 @@ def _exec_tool(name: str, arguments_json: str) -> str:
         args = json.loads(arguments_json or "{}")
     except Exception:
         args = {}
-    if name == "web_fetch":
-        url = args.get("url", "")
-        page = fetch_url(url)
-        return json.dumps({"url": page.url, "title": page.title, "text": page.text})
-    if name == "web_search":
-        q = args.get("query", "")
-        k = int(args.get("k") or 5)
-        results = tavily_search(q, k=k, api_key=get_secret("TAVILY_API_KEY"))
-        return json.dumps({"results": results})
-    return json.dumps({"error": f"unknown tool {name}"})
+    with span("llm.tool", tool=name):
+        if name == "web_fetch":
+            url = args.get("url", "")
+            page = fetch_url(url)
+            return json.dumps({"url": page.url, "title": page.title, "text": page.text})
+        if name == "web_search":
+            q = args.get("query", "")
+            k = int(args.get("k") or 5)
+            results = tavily_search(q, k=k, api_key=get_secret("TAVILY_API_KEY"))
+            return json.dumps({"results": results})
+        return json.dumps({"error": f"unknown tool {name}"})
 
 
 def _build_params(
@@ -147,6 +148,31 @@ def _resolve_tools_until_ready(
     reasoning_effort: Optional[str],
     stop: Optional[Sequence[str]],
     max_loops: int = 4,
+) -> List[Dict[str, Any]]:
+    with span("llm.tool_loop", model=model) as s:
+        messages = _run_tool_loop(
+            client,
+            model,
+            messages,
+            max_completion_tokens,
+            verbosity,
+            reasoning_effort,
+            stop,
+            max_loops,
+        )
+        s.set(messages=len(messages))
+    return messages
+
+
+def _run_tool_loop(
+    client: OpenAI,
+    model: str,
+    messages: List[Dict[str, Any]],
+    max_completion_tokens: int,
+    verbosity: Optional[str],
+    reasoning_effort: Optional[str],
+    stop: Optional[Sequence[str]],
+    max_loops: int,
 ) -> List[Dict[str, Any]]:
     tools = _tool_defs()
     for i in range(max_loops):
@@ -163,7 +189,8 @@ def _resolve_tools_until_ready(
             tool_choice=tool_choice or "auto",
         )
         try:
-            resp = client.chat.completions.create(**params)
+            with span("llm.completion", round=i):
+                resp = client.chat.completions.create(**params)
         except openai.RateLimitError as e:
             logger.error("Rate limit hit in _resolve_tools_until_ready", exc_info=True)
             logger.error("Error details: %s", getattr(e, "__dict__", {}))
@@ -285,13 +312,21 @@ def chat(
     )
     try:
         if streaming:
-            resp = client.chat.completions.create(**params)
-            for event in resp:
-                delta = event.choices[0].delta.content
-                if delta:
-                    yield delta
+            with span("llm.stream", model=params["model"]) as s:
+                start = time.perf_counter()
+                resp = client.chat.completions.create(**params)
+                deltas = 0
+                for event in resp:
+                    delta = event.choices[0].delta.content
+                    if delta:
+                        if not deltas:
+                            s.set(first_token_ms=round((time.perf_counter() - start) * 1000, 1))
+                        deltas += 1
+                        yield delta
+                s.set(deltas=deltas)
         else:
-            resp = client.chat.completions.create(**params)
+            with span("llm.completion", model=params["model"]):
+                resp = client.chat.completions.create(**params)
             return resp.choices[0].message.content or ""
     except openai.RateLimitError as e:
         logger.error("Rate limit hit in chat()", exc_info=True)
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+import hashlib
+import os
+from nya_basic_chat.clients import get_supabase
+from nya_basic_chat.config import UPLOAD_DIR, get_secret
+
+# `put` skips blobs already stored, but refreshes their write time once it is this old
+BLOB_REFRESH_AFTER = timedelta(minutes=10)
+# Orphaned blobs written more recently than this are kept. An upload stores its blob before
+# inserting the attachment row, so a sweep in between must not take the blob from under it.
+BLOB_DELETE_GRACE = timedelta(hours=1)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _stale(written):
+    return datetime.now(timezone.utc) - written > BLOB_REFRESH_AFTER
+
+
+class LocalBlobStore:
+    """Store original uploads on disk under their SHA-256, fanned out by prefix."""
+
+    def __init__(self, root=UPLOAD_DIR / "blobs"):
+        self.root = root
+
+    def _path(self, sha256):
+        return self.root / sha256[:2] / sha256
+
+    def put(self, data: bytes) -> str:
+        sha256 = content_hash(data)
+        path = self._path(sha256)
+        written = self.written_at(sha256)
+        if written is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+        elif _stale(written):
+            os.utime(path)
+        return sha256
+
+    def get(self, sha256: str) -> bytes:
+        return self._path(sha256).read_bytes()
+
+    def written_at(self, sha256: str):
+        """Return when the blob was last put, or None if it is not stored."""
+        try:
+            mtime = self._path(sha256).stat().st_mtime
+        except FileNotFoundError:
+            return None
+        return datetime.fromtimestamp(mtime, timezone.utc)
+
+    def delete(self, sha256: str):
+        self._path(sha256).unlink(missing_ok=True)
+
+
+class SupabaseBlobStore:
+    """Store original uploads in a Supabase Storage bucket under their SHA-256."""
+
+    def __init__(self, sb, bucket):
+        self.bucket = sb.storage.from_(bucket)
+
+    @staticmethod
+    def _path(sha256):
+        return f"{sha256[:2]}/{sha256}"
+
+    def put(self, data: bytes) -> str:
+        sha256 = content_hash(data)
+        written = self.written_at(sha256)
+        # Re-uploading a stale blob is the only way to refresh its write time
+        if written is None or _stale(written):
+            self.bucket.upload(
+                self._path(sha256),
+                data,
+                {"content-type": "application/octet-stream", "upsert": "true"},
+            )
+        return sha256
+
+    def get(self, sha256: str) -> bytes:
+        return self.bucket.download(self._path(sha256))
+
+    def written_at(self, sha256: str):
+        """Return when the blob was last put, or None if it is not stored."""
+        for obj in self.bucket.list(sha256[:2], {"search": sha256}):
+            if obj.get("name") == sha256:
+                stamp = obj.get("updated_at") or obj.get("created_at")
+                return datetime.fromisoformat(stamp) if stamp else datetime.now(timezone.utc)
+        return None
+
+    def delete(self, sha256: str):
+        self.bucket.remove([self._path(sha256)])
+
+
+def get_blob_store():
+    """Return the blob store selected by BLOB_STORE ("local" or "supabase")."""
+    if get_secret("BLOB_STORE", "local") == "supabase":
+        return SupabaseBlobStore(get_supabase(), get_secret("BLOB_BUCKET", "uploads"))
+    return LocalBlobStore()
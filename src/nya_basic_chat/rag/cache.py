@@ -0,0 +1,262 @@
+from array import array
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from nya_basic_chat.config import EMBED_CACHE_FILE
+
+# Roughly 6 KB per text-embedding-3-small vector, so about 300 MB on disk
+EMBED_CACHE_MAX_ENTRIES = 50_000
+# Entries kept per JsonCache table (LLM results are small)
+JSON_CACHE_MAX_ENTRIES = 100_000
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _connect(path):
+    conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model, sha256 of the text).
+
+    Vectors are stored as float32 blobs in SQLite. Hits refresh `last_used`, and
+    once the table grows past `max_entries` the least recently used tenth is evicted.
+    """
+
+    def __init__(self, path=EMBED_CACHE_FILE, max_entries=EMBED_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = _connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+            """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self.conn.commit()
+
+    def get_many(self, model, texts):
+        """Return a list aligned with `texts`, holding a vector or None for each miss."""
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self.lock:
+            for i in range(0, len(hashes), _SQL_BATCH):
+                part = list(set(hashes[i : i + _SQL_BATCH]))
+                marks = ",".join("?" * len(part))
+                rows = self.conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                    [model, *part],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self.conn.commit()
+
+        out = []
+        for h in hashes:
+            blob = found.get(h)
+            out.append(array("f", blob).tolist() if blob is not None else None)
+        return out
+
+    def put_many(self, model, texts, embeddings):
+        now = time.time()
+        rows = [
+            (model, text_hash(t), array("f", emb).tobytes(), now)
+            for t, emb in zip(texts, embeddings)
+        ]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+            self._evict()
+
+    def _evict(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count <= self.max_entries:
+            return
+        excess = count - self.max_entries + self.max_entries // 10
+        self.conn.execute(
+            """
+            DELETE FROM embeddings WHERE rowid IN (
+                SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?
+            )
+            """,
+            (excess,),
+        )
+        self.conn.commit()
+
+
+class JsonCache:
+    """
+    Persistent JSON results keyed by a content hash, for memoizing LLM calls.
+
+    Each cache gets its own table in the embedding cache database and evicts the
+    least recently written entries past `max_entries`.
+    """
+
+    def __init__(self, name, path=EMBED_CACHE_FILE, max_entries=JSON_CACHE_MAX_ENTRIES):
+        self.table = f"json_{name}"
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = _connect(path)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                hash TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                written REAL NOT NULL
+            )
+            """)
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Return a dict of hash -> value for the keys that are cached."""
+        found = {}
+        keys = list(set(keys))
+        with self.lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i : i + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = self.conn.execute(
+                    f"SELECT hash, value FROM {self.table} WHERE hash IN ({marks})", part
+                ).fetchall()
+                found.update((h, json.loads(v)) for h, v in rows)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(h, json.dumps(v), now) for h, v in items.items()]
+        with self.lock:
+            self.conn.executemany(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)", rows)
+            (count,) = self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+            if count > self.max_entries:
+                self.conn.execute(
+                    f"""
+                    DELETE FROM {self.table} WHERE hash IN (
+                        SELECT hash FROM {self.table} ORDER BY written LIMIT ?
+                    )
+                    """,
+                    (count - self.max_entries,),
+                )
+            self.conn.commit()
+
+
+class TTLCache:
+    """
+    In-process map with least-recently-used eviction and a time-to-live per entry.
+
+    `get` returns `default` for missing or expired keys. Past `max_entries`, the
+    least recently used entry is dropped.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Seconds another process's changes to a namespace may go unseen by this one
+NAMESPACE_VERSION_TTL = 5
+
+# Bumped whenever vectors in a namespace are written or deleted; part of result cache keys
+_namespace_versions = {}
+_namespace_versions_lock = threading.Lock()
+# Tokens last read from the shared namespace_versions table
+_shared_versions = TTLCache(max_entries=4096, ttl=NAMESPACE_VERSION_TTL)
+
+
+def namespace_versions(sb, namespaces):
+    """
+    Return `{namespace: version}`, a key part that changes whenever the namespace does.
+
+    A version pairs this process's bump counter with the token any process writes to
+    the namespace_versions table on a change (the sweeper or an ingest worker may run
+    elsewhere). Tokens are re-read at most every NAMESPACE_VERSION_TTL seconds, in one
+    query for all namespaces due.
+    """
+    tokens = {ns: _shared_versions.get(ns) for ns in namespaces}
+    due = sorted(ns for ns, token in tokens.items() if token is None)
+    if due:
+        rows = (
+            sb.table("namespace_versions")
+            .select("namespace, version")
+            .in_("namespace", due)
+            .execute()
+            .data
+        )
+        found = {r["namespace"]: r["version"] for r in rows}
+        for ns in due:
+            tokens[ns] = found.get(ns, "")
+            _shared_versions.put(ns, tokens[ns])
+    with _namespace_versions_lock:
+        return {ns: (_namespace_versions.get(ns, 0), tokens[ns]) for ns in namespaces}
+
+
+def bump_namespace(sb, namespace):
+    """
+    Invalidate cached query results for `namespace`.
+
+    This process sees the change at once; others within NAMESPACE_VERSION_TTL.
+    """
+    with _namespace_versions_lock:
+        _namespace_versions[namespace] = _namespace_versions.get(namespace, 0) + 1
+    token = uuid.uuid4().hex
+    try:
+        sb.table("namespace_versions").upsert({"namespace": namespace, "version": token}).execute()
+    except Exception as e:
+        print("Error publishing namespace version:", e)
+        return
+    _shared_versions.put(namespace, token)
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
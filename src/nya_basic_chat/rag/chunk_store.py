@@ -0,0 +1,118 @@
+from collections import OrderedDict
+import threading
+import time
+from nya_basic_chat.tracing import span
+
+# Columns retrieval reads from the chunks table; main_sections is left out
+CHUNK_COLUMNS = (
+    "id",
+    "attachment_id",
+    "chunk_index",
+    "page_number",
+    "content",
+    "reference_sections",
+)
+# Memory held by cached chunk rows, counted as content and section bytes plus an overhead
+CHUNK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Seconds a cached row is trusted; re-indexing reuses chunk ids, possibly in another process
+CHUNK_CACHE_TTL = 600
+_ROW_OVERHEAD = 200
+# Ids per Supabase `in_` lookup
+_LOOKUP_BATCH = 200
+
+
+def _row_bytes(row):
+    refs = sum(len(s) for s in row.get("reference_sections") or [])
+    return len((row.get("content") or "").encode("utf-8")) + refs + _ROW_OVERHEAD
+
+
+class ChunkCache:
+    """
+    Chunk rows by id, projected to CHUNK_COLUMNS, in an LRU bounded by bytes.
+
+    Rows expire `ttl` seconds after they were cached. `put_many(..., warm=False)`
+    files rows as least recently used, so bulk loads such as a fresh ingest fill
+    spare room without pushing out the hot set.
+    """
+
+    def __init__(self, max_bytes=CHUNK_CACHE_MAX_BYTES, ttl=CHUNK_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.lock = threading.Lock()
+        self.rows = OrderedDict()
+
+    def get_many(self, ids):
+        found = {}
+        now = time.monotonic()
+        with self.lock:
+            for i in ids:
+                entry = self.rows.get(i)
+                if entry is None:
+                    continue
+                expires, row = entry
+                if expires < now:
+                    del self.rows[i]
+                    self.size -= _row_bytes(row)
+                    continue
+                self.rows.move_to_end(i)
+                found[i] = row
+        return found
+
+    def put_many(self, rows, warm=True):
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            for row in rows:
+                row = {c: row.get(c) for c in CHUNK_COLUMNS}
+                old = self.rows.pop(row["id"], None)
+                if old is not None:
+                    self.size -= _row_bytes(old[1])
+                self.rows[row["id"]] = (expires, row)
+                self.rows.move_to_end(row["id"], last=warm)
+                self.size += _row_bytes(row)
+            while self.size > self.max_bytes and self.rows:
+                _, (_, old) = self.rows.popitem(last=False)
+                self.size -= _row_bytes(old)
+
+    def discard(self, ids):
+        with self.lock:
+            for i in ids:
+                old = self.rows.pop(i, None)
+                if old is not None:
+                    self.size -= _row_bytes(old[1])
+
+
+_cache = ChunkCache()
+
+
+def get_chunks(sb, ids):
+    """
+    Return `{id: row}` for the given chunk ids, read through the chunk cache.
+
+    Only misses go to Supabase, and only the CHUNK_COLUMNS are selected.
+    """
+    ids = list(dict.fromkeys(ids))
+    found = _cache.get_many(ids)
+    misses = [i for i in ids if i not in found]
+    with span("rag.fetch_chunks", ids=len(ids), misses=len(misses)):
+        for start in range(0, len(misses), _LOOKUP_BATCH):
+            rows = (
+                sb.table("chunks")
+                .select(",".join(CHUNK_COLUMNS))
+                .in_("id", misses[start : start + _LOOKUP_BATCH])
+                .execute()
+                .data
+            )
+            _cache.put_many(rows)
+            found.update((r["id"], r) for r in rows)
+    return found
+
+
+def remember_chunks(rows):
+    """Add freshly written chunk rows to the cache without displacing hot entries."""
+    _cache.put_many(rows, warm=False)
+
+
+def forget_chunks(ids):
+    """Drop chunk ids that were deleted or are about to be rewritten."""
+    _cache.discard(ids)
@@ -0,0 +1,120 @@
+import json
+import re
+import threading
+from typing import Literal
+from pydantic import BaseModel, Field
+from nya_basic_chat.clients import get_openai
+from nya_basic_chat.rag.cache import JsonCache, text_hash
+from nya_basic_chat.rag.sections import SECTION_REGEX
+
+
+class DocumentTypeResult(BaseModel):
+    doc_type: Literal[
+        "building_code", "engineering_report", "textbook", "specification", "drawing", "general_pdf"
+    ]
+    requires_section_parsing: bool = Field(
+        description="True if this document type contains numbered code sections"
+    )
+
+
+# "CHAPTER 16 STRUCTURAL DESIGN", "SECTION 1613 EARTHQUAKE LOADS"
+CODE_HEADING_REGEX = re.compile(r"(?m)^\s*(?:CHAPTER|SECTION)\s+\d{1,4}\b")
+# Title block fields found on drawings but not on report covers or transmittals, which
+# share "project no", "revision" and "issued for". findall yields the field word, so
+# "Sheet No." and "Sheet 3 of 12" count as one term.
+DRAWING_TITLE_BLOCK_REGEX = re.compile(
+    r"(?i)\b(drawn|checked|scale|sheet|drawing|dwg)"
+    r"(?:\s+by\b|\s*:\s*(?:\d|nts\b|as shown\b)|\s+(?:no\b|number\b|title\b)|\.\s*no\b"
+    r"|\s+\d+\s+of\s+\d+\b)"
+)
+
+# Headings at line starts per non-empty line, above which a sample reads like a code
+SECTION_DENSITY = 0.15
+MIN_SECTION_HEADINGS = 4
+MIN_TITLE_BLOCK_TERMS = 3
+
+
+def classify_heuristic(sample_text: str):
+    """
+    Classify the obvious cases locally; return (doc_type, requires_parsing) or None.
+
+    Samples with 3-4 digit section numbers (1613.2, 1004.1) under upper-case
+    CHAPTER/SECTION headings, or dense in them, are codes; samples with several title
+    block terms are drawings. Anything else, including textbooks and reports with
+    "SECTION 1" headings and 1.1.2 numbering, is left to the LLM.
+    """
+    lines = [ln for ln in sample_text.splitlines() if ln.strip()]
+    if not lines:
+        return None
+
+    title_block_terms = {m.lower() for m in DRAWING_TITLE_BLOCK_REGEX.findall(sample_text)}
+    if len(title_block_terms) >= MIN_TITLE_BLOCK_TERMS and len(sample_text.split()) < 300:
+        return "drawing", False
+
+    headings = [m.group() for ln in lines if (m := SECTION_REGEX.match(ln.strip()))]
+    # Textbooks and reports number from the chapter or section (3.2.1, 1.1.2); codes
+    # number from a 3-4 digit section (1613.2), so only those leads count
+    code_leads = [h for h in headings if len(h.split(".")[0]) >= 3]
+    if CODE_HEADING_REGEX.search(sample_text) and len(code_leads) >= 2:
+        return "building_code", True
+    dense = len(headings) / len(lines) >= SECTION_DENSITY
+    if dense and len(code_leads) >= MIN_SECTION_HEADINGS:
+        return "building_code", True
+
+    return None
+
+
+_doc_type_cache = None
+_lock = threading.Lock()
+
+
+def _get_cache():
+    global _doc_type_cache
+    with _lock:
+        if _doc_type_cache is None:
+            _doc_type_cache = JsonCache("doc_type")
+        return _doc_type_cache
+
+
+def classify_with_llm(sample_text: str):
+    client = get_openai()
+
+    schema = DocumentTypeResult.model_json_schema()
+
+    prompt = f"""
+    Classify the document based on the sample text.
+    Return ONLY a JSON object following the schema.
+    
+    Sample: {sample_text}
+    """
+
+    out = client.chat.completions.create(
+        model="gpt-5-nano",
+        messages=[{"role": "user", "content": prompt}],
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "doc_type_result", "schema": schema},
+        },
+    )
+
+    raw = out.choices[0].message.content
+    parsed_json = json.loads(raw)
+    parsed: DocumentTypeResult = DocumentTypeResult(**parsed_json)
+    return parsed.doc_type, parsed.requires_section_parsing
+
+
+def classify_document_type(sample_text: str):
+    """Return (doc_type, requires_section_parsing), asking the LLM only when unsure."""
+    result = classify_heuristic(sample_text)
+    if result is not None:
+        return result
+
+    cache = _get_cache()
+    key = text_hash(sample_text)
+    cached = cache.get_many([key]).get(key)
+    if cached is not None:
+        return tuple(cached)
+
+    result = classify_with_llm(sample_text)
+    cache.put_many({key: list(result)})
+    return result
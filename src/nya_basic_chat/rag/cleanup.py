@@ -1,93 +1,163 @@
-from supabase import create_client
-from pinecone import Pinecone
-from nya_basic_chat.config import get_secret
-from datetime import datetime, timezone
-
-
-def get_supabase():
-    return create_client(get_secret("SUPABASE_URL"), get_secret("SUPABASE_SERVICE_ROLE_KEY"))
-
-
-def get_pinecone():
-    pc = Pinecone(api_key=get_secret("PINECONE_API_KEY"))
-    return pc.Index(get_secret("PINECONE_INDEX_NAME"))
-
-
-def cleanup_expired_temp_files(user_id):
-    sb = get_supabase()
-    index = get_pinecone()
-
+from nya_basic_chat.clients import get_supabase
+from nya_basic_chat.rag.blobs import BLOB_DELETE_GRACE, get_blob_store
+from nya_basic_chat.rag.cache import bump_namespace
+from nya_basic_chat.rag.chunk_store import forget_chunks
+from nya_basic_chat.rag.processor import get_namespace
+from nya_basic_chat.rag.vectorstore import get_vector_store
+from nya_basic_chat.rag.writer import select_all
+from datetime import datetime, timedelta, timezone
+
+# Temporary uploads are deleted once they are this old
+TEMP_FILE_TTL = timedelta(days=7)
+# Expired attachments fetched per sweep query
+EXPIRE_BATCH = 200
+# Attachment ids per bulk `in_` delete
+DELETE_BATCH = 200
+
+
+def _delete_orphan_blobs(sb, hashes):
+    """
+    Delete the stored originals no remaining attachment refers to.
+
+    Blobs put within BLOB_DELETE_GRACE are kept: an upload of the same file may have
+    stored its blob and not yet inserted the attachment row that refers to it.
+    Returns the hashes of unreferenced blobs kept for that reason.
+    """
+    if not hashes:
+        return set()
     rows = (
         sb.table("attachments")
-        .select("*")
-        .eq("user_id", user_id)
-        .eq("is_temp", True)
+        .select("content_sha256")
+        .in_("content_sha256", sorted(hashes))
         .execute()
         .data
     )
+    blobs = get_blob_store()
+    recent = set()
+    for sha256 in hashes - {r["content_sha256"] for r in rows}:
+        try:
+            written = blobs.written_at(sha256)
+            if written is None:
+                continue
+            if datetime.now(timezone.utc) - written < BLOB_DELETE_GRACE:
+                recent.add(sha256)
+                continue
+            blobs.delete(sha256)
+        except Exception as e:
+            print("Error deleting blob:", e)
+    return recent
+
+
+def cleanup_orphan_blobs():
+    """
+    Settle the orphaned blobs recorded while inside their grace period.
+
+    Records older than BLOB_DELETE_GRACE are checked again, DELETE_BATCH at a time:
+    blobs still unreferenced are deleted, and records whose blob was deleted or is
+    referenced again are dropped. Returns how many records were settled.
+    """
+    sb = get_supabase()
+    cutoff = (datetime.now(timezone.utc) - BLOB_DELETE_GRACE).isoformat()
+    hashes = [
+        r["content_sha256"]
+        for r in select_all(
+            sb.table("orphan_blobs")
+            .select("content_sha256")
+            .lte("recorded_at", cutoff)
+            .order("content_sha256")
+        )
+    ]
+
+    settled = 0
+    for start in range(0, len(hashes), DELETE_BATCH):
+        batch = set(hashes[start : start + DELETE_BATCH])
+        # A blob put again since it was recorded waits for the next sweep
+        done = sorted(batch - _delete_orphan_blobs(sb, batch))
+        if done:
+            sb.table("orphan_blobs").delete().in_("content_sha256", done).execute()
+        settled += len(done)
+    return settled
+
+
+def _delete_attachments(sb, store, rows):
+    """
+    Remove attachments with their vectors, chunks and processing status, set at a time.
+
+    Chunk ids come from one paged select per DELETE_BATCH attachments. Vectors are
+    deleted per namespace in the store's own batches, and each table with one `in_` delete.
+    Blobs are shared by content hash, so one is deleted only with its last attachment.
+    """
+    for start in range(0, len(rows), DELETE_BATCH):
+        batch = rows[start : start + DELETE_BATCH]
+        ids = [r["id"] for r in batch]
+        namespaces = {r["id"]: get_namespace(r) for r in batch}
+
+        chunk_rows = select_all(
+            sb.table("chunks").select("id, attachment_id").in_("attachment_id", ids).order("id")
+        )
+        by_ns = {}
+        for c in chunk_rows:
+            by_ns.setdefault(namespaces[c["attachment_id"]], []).append(c["id"])
+        for namespace, chunk_ids in by_ns.items():
+            try:
+                store.delete(chunk_ids, namespace)
+            except Exception as e:
+                print("Error deleting vectors:", e)
+            bump_namespace(sb, namespace)
+            forget_chunks(chunk_ids)
+
+        sb.table("attachment_processing_status").delete().in_("attachment_id", ids).execute()
+        sb.table("chunks").delete().in_("attachment_id", ids).execute()
+        sb.table("attachments").delete().in_("id", ids).execute()
+        recent = _delete_orphan_blobs(
+            sb, {r["content_sha256"] for r in batch if r.get("content_sha256")}
+        )
+        if recent:
+            # cleanup_orphan_blobs deletes them once the grace period is over
+            sb.table("orphan_blobs").upsert(
+                [{"content_sha256": h} for h in sorted(recent)]
+            ).execute()
 
-    now = datetime.now(timezone.utc)
-    expired = []
-    for r in rows:
-        created = datetime.fromisoformat(r["created_at"])
-        if (now - created).days >= 7:
-            expired.append(r)
 
-    for r in expired:
-        attachment_id = r["id"]
-        ns = str(user_id)
+def cleanup_expired_temp_files(user_id=None, max_age=TEMP_FILE_TTL):
+    """
+    Delete temporary attachments older than `max_age`, for one user or for everyone.
 
-        chunk_rows = (
-            sb.table("chunks").select("id").eq("attachment_id", attachment_id).execute().data
+    Expired rows are found through the partial index on attachments (created_at)
+    where is_temp, oldest first, EXPIRE_BATCH at a time. Returns how many were deleted.
+    """
+    sb = get_supabase()
+    store = get_vector_store()
+    cutoff = (datetime.now(timezone.utc) - max_age).isoformat()
+
+    deleted = 0
+    while True:
+        query = (
+            sb.table("attachments")
+            .select("id, user_id, category, content_sha256")
+            .eq("is_temp", True)
+            .lte("created_at", cutoff)
         )
+        if user_id is not None:
+            query = query.eq("user_id", user_id)
+        rows = query.order("created_at").limit(EXPIRE_BATCH).execute().data
 
-        chunk_ids = [c["id"] for c in chunk_rows]
-        if chunk_ids:
-            try:
-                index.delete(ids=chunk_ids, namespace=ns)
-            except Exception as e:
-                print("Error deleting Pinecone vectors:", e)
-
-        sb.table("attachment_processing_status").delete().eq("attachment_id", r["id"]).execute()
-        sb.table("chunks").delete().eq("attachment_id", r["id"]).execute()
-        sb.table("attachments").delete().eq("id", r["id"]).execute()
+        _delete_attachments(sb, store, rows)
+        deleted += len(rows)
+        if len(rows) < EXPIRE_BATCH:
+            return deleted
 
 
 def clear_user_temp_files(user_id):
     sb = get_supabase()
-    index = get_pinecone()
+    store = get_vector_store()
 
-    # 1. Get all temp attachments for this user
     rows = (
         sb.table("attachments")
-        .select("*")
+        .select("id, user_id, category, content_sha256")
         .eq("user_id", user_id)
         .eq("is_temp", True)
         .execute()
         .data
     )
-
-    # 2. Process each temp attachment
-    for r in rows:
-        attachment_id = r["id"]
-        namespace = str(user_id) if r["category"] != "global_perm" else "global"
-
-        # 2a. Get associated chunk vector IDs
-        chunk_rows = (
-            sb.table("chunks").select("id").eq("attachment_id", attachment_id).execute().data
-        )
-        chunk_ids = [c["id"] for c in chunk_rows]
-
-        # 2b. Delete only those vectors from Pinecone
-        if chunk_ids:
-            try:
-                index.delete(ids=chunk_ids, namespace=namespace)
-            except Exception as e:
-                print("Error deleting vectors:", e)
-
-        # 2c. Delete temp chunks, processing status, and attachment record
-        sb.table("attachment_processing_status").delete().eq(
-            "attachment_id", attachment_id
-        ).execute()
-        sb.table("chunks").delete().eq("attachment_id", attachment_id).execute()
-        sb.table("attachments").delete().eq("id", attachment_id).execute()
+    _delete_attachments(sb, store, rows)
@@ -0,0 +1,184 @@
+import hashlib
+from nya_basic_chat.rag.embedder import get_encoding
+
+# Prompt tokens the retrieved excerpts may take up in total
+CONTEXT_MAX_TOKENS = 6000
+# Matches scoring below this cosine similarity are never used
+CONTEXT_MIN_SCORE = 0.2
+# ...nor are those scoring below this fraction of the best match
+CONTEXT_RELATIVE_CUTOFF = 0.75
+# Word-set Jaccard similarity above which two chunks count as the same text
+NEAR_DUPLICATE_JACCARD = 0.9
+# Characters of a chunk's start searched for in its predecessor to find their overlap
+_OVERLAP_PROBE_CHARS = 64
+# Tokens of the newline format_context puts between excerpts
+_SEPARATOR_TOKENS = 1
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def _jaccard(a, b):
+    return len(a & b) / (len(a | b) or 1)
+
+
+def _join_overlapping(first, second):
+    """Return `first` + `second` with their shared text once, or None if they do not overlap."""
+    probe = second[:_OVERLAP_PROBE_CHARS]
+    at = first.rfind(probe) if probe else -1
+    if at < 0 or not second.startswith(first[at:]):
+        return None
+    return first + second[len(first) - at :]
+
+
+def _pages(first_page, last_page):
+    if first_page == last_page:
+        return f"Page {first_page}"
+    return f"Pages {first_page}-{last_page}"
+
+
+def _render(file_name, first_page, last_page, content):
+    return f"Source: [{file_name} - {_pages(first_page, last_page)}]\nContent:\n{content}"
+
+
+def _rendered_tokens(file_name, first_page, last_page, content):
+    return count_tokens(_render(file_name, first_page, last_page, content)) + _SEPARATOR_TOKENS
+
+
+class Excerpt:
+    """
+    One passage of context: a chunk, or a run of adjacent chunks joined at their overlap.
+
+    `tokens` counts the excerpt as format_context renders it, source header included.
+    """
+
+    def __init__(self, match, row):
+        self.score = match.score
+        self.file_name = (match.metadata or {}).get("file_name")
+        self.attachment_id = row.get("attachment_id")
+        self.first_index = self.last_index = row.get("chunk_index")
+        self.first_page = self.last_page = row.get("page_number")
+        self.content = row["content"]
+        self.tokens = _rendered_tokens(self.file_name, self.first_page, self.last_page, self.content)
+        self.words = set(self.content.split())
+        self.chunk_ids = {row["id"]}
+        self.references = list(row.get("reference_sections") or [])
+
+    def pages(self):
+        return _pages(self.first_page, self.last_page)
+
+    def render(self):
+        return _render(self.file_name, self.first_page, self.last_page, self.content)
+
+    def try_join(self, row, budget):
+        """Absorb an adjacent chunk of the same attachment if it adds at most `budget` tokens."""
+        if self.attachment_id is None or row.get("attachment_id") != self.attachment_id:
+            return False
+        index = row.get("chunk_index")
+        if index == self.last_index + 1:
+            joined = _join_overlapping(self.content, row["content"])
+            first_page, last_page = self.first_page, row.get("page_number")
+        elif index == self.first_index - 1:
+            joined = _join_overlapping(row["content"], self.content)
+            first_page, last_page = row.get("page_number"), self.last_page
+        else:
+            return False
+        if joined is None:
+            return False
+        tokens = _rendered_tokens(self.file_name, first_page, last_page, joined)
+        if tokens - self.tokens > budget:
+            return False
+
+        if index > self.last_index:
+            self.last_index = index
+        else:
+            self.first_index = index
+        self.first_page, self.last_page = first_page, last_page
+        self.content, self.tokens = joined, tokens
+        self.words = set(joined.split())
+        self.chunk_ids.add(row["id"])
+        self.references += row.get("reference_sections") or []
+        return True
+
+
+def assemble_context(
+    matches,
+    rows_by_id,
+    max_tokens=CONTEXT_MAX_TOKENS,
+    min_score=CONTEXT_MIN_SCORE,
+    relative_cutoff=CONTEXT_RELATIVE_CUTOFF,
+    file_ids=None,
+):
+    """
+    Pick the excerpts to inject from the matches of every namespace.
+
+    Matches are merged by score and cut off below `min_score` or below
+    `relative_cutoff` times the best score. Chunks of the attachments in `file_ids`
+    (the temporary files the user selected) only need `min_score`, so a strong
+    library match cannot crowd out the files the question is about. Exact and
+    near-duplicate chunks (e.g. the same upload in two namespaces) are dropped, and
+    adjacent chunks of one document are joined at their overlap instead of
+    repeating it. Excerpts are added best first while they fit in `max_tokens`,
+    counted as format_context renders them. Returns them best first.
+    """
+    candidates = sorted(
+        ((m, rows_by_id[m.id]) for m in matches if m.id in rows_by_id),
+        key=lambda c: c[0].score,
+        reverse=True,
+    )
+    if not candidates:
+        return []
+    floor = max(min_score, candidates[0][0].score * relative_cutoff)
+    selected = set(file_ids or ())
+    candidates = [
+        (m, row)
+        for m, row in candidates
+        if m.score >= floor or (row.get("attachment_id") in selected and m.score >= min_score)
+    ]
+
+    excerpts = []
+    _fill(excerpts, candidates, max_tokens)
+    return excerpts
+
+
+def extend_context(excerpts, matches, rows_by_id, max_tokens=CONTEXT_MAX_TOKENS):
+    """Append excerpts for `matches`, in order, within what is left of `max_tokens`."""
+    _fill(excerpts, [(m, rows_by_id[m.id]) for m in matches if m.id in rows_by_id], max_tokens)
+    return excerpts
+
+
+def _fill(excerpts, candidates, max_tokens):
+    seen = set()
+    used = sum(e.tokens for e in excerpts)
+    for match, row in candidates:
+        if any(row["id"] in e.chunk_ids for e in excerpts):
+            continue
+        digest = hashlib.sha256(row["content"].encode("utf-8")).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+
+        words = set(row["content"].split())
+        if any(_jaccard(words, e.words) >= NEAR_DUPLICATE_JACCARD for e in excerpts):
+            continue
+
+        joined = False
+        for e in excerpts:
+            before = e.tokens
+            if e.try_join(row, max_tokens - used):
+                used += e.tokens - before
+                joined = True
+                break
+        if joined:
+            continue
+
+        excerpt = Excerpt(match, row)
+        if used + excerpt.tokens > max_tokens:
+            continue
+        excerpts.append(excerpt)
+        used += excerpt.tokens
+
+
+def format_context(excerpts):
+    return "\n".join(e.render() for e in excerpts)
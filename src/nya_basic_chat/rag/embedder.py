@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import openai
+import tiktoken
+from nya_basic_chat.rag.retry import with_retries
+
+EMBED_MODEL = "text-embedding-3-small"
+# Token budget per embeddings request (the API caps a request at 300k tokens)
+EMBED_MAX_BATCH_TOKENS = 32_000
+# Inputs per embeddings request (the API caps a request at 2,048 inputs)
+EMBED_MAX_BATCH_INPUTS = 2048
+# Embeddings requests in flight at once
+EMBED_WORKERS = 4
+
+# Errors worth retrying for a single batch; anything else fails the call
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=EMBED_MODEL):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def pack_batches(
+    texts,
+    max_tokens=EMBED_MAX_BATCH_TOKENS,
+    max_inputs=EMBED_MAX_BATCH_INPUTS,
+    token_counts=None,
+):
+    """
+    Split `texts` into runs of indices that fit the token and input budgets.
+
+    Pass `token_counts` when the caller already tokenized the texts (the chunker
+    does); otherwise they are tokenized here.
+    """
+    if token_counts is None:
+        enc = get_encoding()
+        token_counts = [len(t) for t in enc.encode_batch(texts, disallowed_special=())]
+    batches = []
+    batch, batch_tokens = [], 0
+    for i, n in enumerate(token_counts):
+        if batch and (batch_tokens + n > max_tokens or len(batch) >= max_inputs):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += n
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def embed_batched(
+    client,
+    texts,
+    model=EMBED_MODEL,
+    max_tokens=EMBED_MAX_BATCH_TOKENS,
+    max_inputs=EMBED_MAX_BATCH_INPUTS,
+    workers=EMBED_WORKERS,
+    attempts=4,
+    token_counts=None,
+):
+    """
+    Embed `texts` in token-budgeted batches run concurrently on a bounded pool.
+
+    Embeddings are returned in input order. Each batch is retried on its own, so a
+    rate limit on one batch does not resend the others. `token_counts` is passed
+    on to pack_batches.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+
+    def run(batch):
+        response = with_retries(
+            lambda: client.embeddings.create(model=model, input=[texts[i] for i in batch]),
+            attempts=attempts,
+            backoff=1.0,
+            retry_on=RETRYABLE_ERRORS,
+        )
+        return [r.embedding for r in sorted(response.data, key=lambda r: r.index)]
+
+    batches = pack_batches(
+        texts, max_tokens=max_tokens, max_inputs=max_inputs, token_counts=token_counts
+    )
+    out = [None] * len(texts)
+
+    if len(batches) == 1:
+        results = [run(batches[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            results = list(pool.map(run, batches))
+
+    for batch, embeddings in zip(batches, results):
+        for i, emb in zip(batch, embeddings):
+            out[i] = emb
+    return out
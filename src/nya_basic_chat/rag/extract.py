@@ -0,0 +1,166 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import io
+import itertools
+import multiprocessing
+import os
+import tempfile
+import threading
+import fitz
+from PyPDF2 import PdfReader
+
+# Pages handed to a worker process per task
+PAGES_PER_TASK = 16
+# Documents with fewer pages are extracted in the calling thread; the round trip to a
+# worker process costs more than it saves
+MIN_POOL_PAGES = 64
+
+_pool = None
+_pool_lock = threading.Lock()
+# MuPDF is not thread-safe and ingest jobs run on several threads, so engine calls made
+# in this process (page counts, small documents) run one at a time
+_engine_lock = threading.Lock()
+
+
+# ---------- engines ----------
+# Each engine is (page_count(path), extract_range(path, start, stop)). They take a
+# file path rather than bytes so worker processes don't each receive a copy of the PDF.
+
+
+def _fitz_page_count(path):
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def _fitz_range(path, start, stop):
+    with fitz.open(path) as doc:
+        return [
+            {"page": i + 1, "text": (doc.load_page(i).get_text("text") or "").strip()}
+            for i in range(start, stop)
+        ]
+
+
+def _pypdf2_page_count(path):
+    return len(PdfReader(path).pages)
+
+
+def _pypdf2_range(path, start, stop):
+    reader = PdfReader(path)
+    return [
+        {"page": i + 1, "text": (reader.pages[i].extract_text() or "").strip()}
+        for i in range(start, stop)
+    ]
+
+
+ENGINES = {
+    "fitz": (_fitz_page_count, _fitz_range),
+    "pypdf2": (_pypdf2_page_count, _pypdf2_range),
+}
+
+
+def _default_engine():
+    from nya_basic_chat.config import get_secret
+
+    return get_secret("PDF_EXTRACT_ENGINE", "fitz")
+
+
+def _default_workers():
+    from nya_basic_chat.config import get_secret
+
+    return int(get_secret("PDF_EXTRACT_WORKERS", 0) or os.cpu_count() or 1)
+
+
+def _locked(fn, *args):
+    with _engine_lock:
+        return fn(*args)
+
+
+def _get_pool():
+    """
+    Process-wide extraction pool of _default_workers() processes, started on first use.
+
+    Concurrent ingest jobs share it, so extraction never runs more processes than the
+    cap however many jobs are running, and worker start-up is paid once per process.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_default_workers(), mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drop a pool whose worker died, so the next document starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pages(
+    file_bytes,
+    engine=None,
+    workers=None,
+    pages_per_task=PAGES_PER_TASK,
+    on_page_count=None,
+    start_page=1,
+    end_page=None,
+):
+    """
+    Yield `{page, text}` dicts in page order, from `start_page` to `end_page` inclusive.
+
+    Page ranges of documents with at least MIN_POOL_PAGES pages are extracted in the
+    shared process pool, with at most two ranges per worker in flight, so text
+    extraction scales with cores without reading ahead the whole document. Page
+    counts and smaller documents are read in this process, one engine call at a time.
+    `on_page_count`, if given, is called with the page total first.
+    """
+    page_count, extract_range = ENGINES[engine or _default_engine()]
+    workers = workers or _default_workers()
+
+    if isinstance(file_bytes, io.IOBase):
+        file_bytes = file_bytes.read()
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    pending = deque()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(file_bytes)
+
+        count = _locked(page_count, path)
+        if on_page_count is not None:
+            on_page_count(count)
+        stop = min(count, end_page or count)
+        ranges = [
+            (s, min(s + pages_per_task, stop)) for s in range(start_page - 1, stop, pages_per_task)
+        ]
+
+        if workers <= 1 or len(ranges) <= 1 or stop - (start_page - 1) < MIN_POOL_PAGES:
+            for start, stop in ranges:
+                yield from _locked(extract_range, path, start, stop)
+            return
+
+        pool = _get_pool()
+        try:
+            todo = iter(ranges)
+            pending.extend(
+                pool.submit(extract_range, path, start, stop)
+                for start, stop in itertools.islice(todo, workers * 2)
+            )
+            while pending:
+                future = pending.popleft()
+                for start, stop in itertools.islice(todo, 1):
+                    pending.append(pool.submit(extract_range, path, start, stop))
+                yield from future.result()
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+    finally:
+        # Ranges not yet started are dropped if the caller stops early or a range fails
+        for future in pending:
+            future.cancel()
+        os.remove(path)
@@ -1,10 +1,4 @@
 from nya_basic_chat.rag.retriever import retrieve_chunks
-from supabase import create_client
-from nya_basic_chat.config import get_secret
-
-
-def get_supabase():
-    return create_client(get_secret("SUPABASE_URL"), get_secret("SUPABASE_SERVICE_ROLE_KEY"))
 
 
 def inject(system_prompt, user_prompt, user_id, file_ids):
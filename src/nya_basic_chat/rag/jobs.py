@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+from nya_basic_chat.config import get_secret
+from nya_basic_chat.clients import get_supabase
+from nya_basic_chat.rag.processor import ingest_file
+
+# Status rows in attachment_processing_status move pending -> processing -> ready | error
+ACTIVE_STATUSES = ("pending", "processing")
+# A processing job with no checkpoint for this long is assumed to have lost its worker
+STALE_AFTER = timedelta(minutes=15)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Process-wide worker pool; it outlives Streamlit reruns and browser refreshes."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=int(get_secret("INGEST_WORKERS", 2)),
+                thread_name_prefix="ingest",
+            )
+            sb = get_supabase()
+            # Jobs whose worker died mid-run go back to the queue; they resume from checkpoint
+            stale = (datetime.utcnow() - STALE_AFTER).isoformat()
+            sb.table("attachment_processing_status").update({"status": "pending"}).eq(
+                "status", "processing"
+            ).lt("last_updated", stale).execute()
+            # Pick up jobs queued before this process started
+            for r in (
+                sb.table("attachment_processing_status")
+                .select("attachment_id")
+                .eq("status", "pending")
+                .execute()
+                .data
+            ):
+                _pool.submit(_run_job, r["attachment_id"])
+        return _pool
+
+
+def start_workers():
+    _get_pool()
+
+
+def enqueue_ingest(attachment_id):
+    """Queue an attachment whose row and stored blob already exist."""
+    get_supabase().table("attachment_processing_status").upsert(
+        {
+            "attachment_id": attachment_id,
+            "status": "pending",
+            "last_updated": datetime.utcnow().isoformat(),
+        }
+    ).execute()
+    _get_pool().submit(_run_job, attachment_id)
+
+
+def retry_ingest(attachment_id):
+    """Requeue a failed attachment; it continues from its last checkpoint."""
+    retried = (
+        get_supabase()
+        .table("attachment_processing_status")
+        .update({"status": "pending", "error_message": None, "dismissed": False})
+        .eq("attachment_id", attachment_id)
+        .eq("status", "error")
+        .execute()
+        .data
+    )
+    if retried:
+        _get_pool().submit(_run_job, attachment_id)
+
+
+def _run_job(attachment_id):
+    sb = get_supabase()
+
+    # Claim the job; another worker or process may already have taken it
+    claimed = (
+        sb.table("attachment_processing_status")
+        .update({"status": "processing", "last_updated": datetime.utcnow().isoformat()})
+        .eq("attachment_id", attachment_id)
+        .eq("status", "pending")
+        .execute()
+        .data
+    )
+    if not claimed:
+        return
+
+    try:
+        row = sb.table("attachments").select("*").eq("id", attachment_id).single().execute().data
+        if not row.get("content_sha256"):
+            # Queued before uploads were stored by hash; there is no stored original to read
+            raise ValueError("The original file was not stored; please upload it again")
+        status = claimed[0]
+        resume = status if status.get("resume_chunk_index") is not None else None
+        ingest_file(row, resume=resume)
+    except Exception as e:
+        # ingest_file records the error on the status row itself
+        print("Error ingesting attachment:", attachment_id, e)
+        sb.table("attachment_processing_status").update(
+            {"status": "error", "error_message": str(e)}
+        ).eq("attachment_id", attachment_id).eq("status", "processing").execute()
+
+
+def ingest_statuses(attachment_ids):
+    """Return `{attachment_id: status}` for the attachments that have a status row."""
+    if not attachment_ids:
+        return {}
+    rows = (
+        get_supabase()
+        .table("attachment_processing_status")
+        .select("attachment_id, status")
+        .in_("attachment_id", list(attachment_ids))
+        .execute()
+        .data
+    )
+    return {r["attachment_id"]: r["status"] for r in rows}
+
+
+def dismiss_ingest(attachment_id):
+    """Hide a failed attachment from the job list; retry_ingest still works on it."""
+    get_supabase().table("attachment_processing_status").update({"dismissed": True}).eq(
+        "attachment_id", attachment_id
+    ).eq("status", "error").execute()
+
+
+def list_ingest_jobs(user_id, statuses=ACTIVE_STATUSES):
+    """
+    Return the user's undismissed attachments in the given states with their progress.
+
+    The user_ingest_jobs view joins status rows to their attachment's owner, so this is
+    one query filtered by user and status on the server.
+    """
+    return (
+        get_supabase()
+        .table("user_ingest_jobs")
+        .select("*")
+        .eq("user_id", user_id)
+        .in_("status", list(statuses))
+        .eq("dismissed", False)
+        .execute()
+        .data
+    )
@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    pass
+
+
+def _put(q, item, stop, timing):
+    started = time.perf_counter()
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            timing["wait"] += time.perf_counter() - started
+            return
+        except queue.Full:
+            continue
+    raise _Stopped
+
+
+def _drain(q, stop, timing):
+    """Yield items from a queue until the upstream stage signals it is done."""
+    while True:
+        started = time.perf_counter()
+        while True:
+            if stop.is_set():
+                raise _Stopped
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        timing["wait"] += time.perf_counter() - started
+        if item is _DONE:
+            return
+        timing["items_in"] += 1
+        yield item
+
+
+def run_pipeline(source, *stages, maxsize=4, names=None, stats=None):
+    """
+    Run `source` and each stage in its own thread, joined by bounded queues.
+
+    `source` is an iterable. Each stage is a callable that takes an iterable of
+    items from the previous stage and returns an iterable of items for the next,
+    so stages can batch freely (e.g. a generator that groups chunks). Items keep
+    their order. The outputs of the last stage are returned as a list.
+
+    If any stage raises, the other stages are stopped and the first exception is
+    re-raised in the calling thread.
+
+    When a `stats` dict is given, it is filled with one entry per stage (keyed by
+    `names`, source first) holding wall time, time blocked on the neighbouring
+    queues, busy time (the difference) and item counts.
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=maxsize) for _ in stages]
+    results = []
+    names = names or ["source", *(f"stage{i + 1}" for i in range(len(stages)))]
+    timings = [{"wait": 0.0, "items_in": 0, "items_out": 0} for _ in names]
+
+    def run(produce, outbox, timing):
+        items = None
+        started = time.perf_counter()
+        try:
+            items = produce()
+            for item in items:
+                timing["items_out"] += 1
+                if outbox is None:
+                    results.append(item)
+                else:
+                    _put(outbox, item, stop, timing)
+            if outbox is not None:
+                _put(outbox, _DONE, stop, timing)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            # Let generator stages release resources (files, pools) when stopped early
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            timing["wall"] = time.perf_counter() - started
+
+    threads = [
+        threading.Thread(target=run, args=(lambda: source, queues[0], timings[0]), daemon=True)
+    ]
+    for i, stage in enumerate(stages):
+        inbox = queues[i]
+        outbox = queues[i + 1] if i + 1 < len(queues) else None
+        timing = timings[i + 1]
+        produce = lambda stage=stage, inbox=inbox, timing=timing: stage(  # noqa: E731
+            _drain(inbox, stop, timing)
+        )
+        threads.append(threading.Thread(target=run, args=(produce, outbox, timing), daemon=True))
+
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if stats is not None:
+        for name, timing in zip(names, timings):
+            stats[name] = {**timing, "busy": timing["wall"] - timing["wait"]}
+
+    if errors:
+        raise errors[0]
+    return results
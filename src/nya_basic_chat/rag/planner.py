@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from nya_basic_chat.rag.vectorstore import matches_filter
+from nya_basic_chat.tracing import bind
+
+
+@dataclass(frozen=True)
+class QuerySpec:
+    namespace: str
+    filter: dict | None
+    top_k: int
+    # The specs a merged query stands for; empty for a query planned as given
+    branches: tuple = ()
+
+
+def plan_queries(specs):
+    """
+    Merge queries against the same namespace into one with an `$or` filter.
+
+    The merged query asks for the combined `top_k`, so it can return as many
+    matches as the separate queries did, ranked together by score, and keeps the
+    original specs as its `branches` so run_queries can hold each to its own
+    `top_k`. Namespaces keep the order in which they first appear.
+    """
+    by_ns = {}
+    for spec in specs:
+        by_ns.setdefault(spec.namespace, []).append(spec)
+
+    plan = []
+    for namespace, group in by_ns.items():
+        if len(group) == 1:
+            plan.append(group[0])
+            continue
+        filters = [s.filter for s in group]
+        # A query without a filter already covers every other one in its namespace
+        merged = None if any(f is None for f in filters) else {"$or": filters}
+        plan.append(QuerySpec(namespace, merged, sum(s.top_k for s in group), tuple(group)))
+    return plan
+
+
+def _short_branches(spec, matches):
+    """
+    Branches of a merged query that got fewer than their own `top_k` matches.
+
+    A merged query that came back short returned everything its filter matches, so
+    no branch can gain from a query of its own.
+    """
+    if not spec.branches or len(matches) < spec.top_k:
+        return []
+    return [
+        b
+        for b in spec.branches
+        if sum(matches_filter(m.metadata, b.filter) for m in matches) < b.top_k
+    ]
+
+
+def run_queries(query, vector, plan, fetch=None):
+    """
+    Run the planned queries concurrently and return `(matches, fetched)`.
+
+    `query` is called like `VectorStore.query` (a store's bound method, or a
+    cached wrapper around one). Matches are grouped in plan order. When one
+    branch of a merged query is crowded out by the others (a large permanent
+    library outscoring the selected temporary files), that branch is topped up
+    with its own query, so each branch still gets up to its `top_k` matches.
+    When `fetch` is given it is called with the match ids of each query as soon
+    as that query returns, so lookups for early queries overlap the ones still
+    running; `fetched` merges the dicts it returns.
+    """
+    results = [[] for _ in plan]
+    fetched = {}
+    if not plan:
+        return [], fetched
+
+    with ThreadPoolExecutor(max_workers=2 * len(plan)) as pool:
+
+        def submit(spec):
+            return pool.submit(
+                bind(query), vector, spec.namespace, filter=spec.filter, top_k=spec.top_k
+            )
+
+        queries = {submit(q): i for i, q in enumerate(plan)}
+        lookups, top_ups = [], {}
+        for future in as_completed(queries):
+            i = queries[future]
+            matches = future.result()
+            results[i] = matches
+            for branch in _short_branches(plan[i], matches):
+                top_ups[submit(branch)] = i
+            if fetch is not None and matches:
+                lookups.append(pool.submit(bind(fetch), [m.id for m in matches]))
+        for future in as_completed(top_ups):
+            i = top_ups[future]
+            seen = {m.id for m in results[i]}
+            extra = [m for m in future.result() if m.id not in seen]
+            results[i] = results[i] + extra
+            if fetch is not None and extra:
+                lookups.append(pool.submit(bind(fetch), [m.id for m in extra]))
+        for future in lookups:
+            fetched.update(future.result())
+
+    return [m for matches in results for m in matches], fetched
@@ -1,122 +1,43 @@
 from datetime import datetime
-from supabase import create_client
-from openai import OpenAI
-from pinecone import Pinecone
-import tiktoken
-import re
-from nya_basic_chat.config import get_secret
-from pydantic import BaseModel, Field
-from typing import List, Literal
-import io
-import json
-from PyPDF2 import PdfReader
-
-
-def get_supabase():
-    return create_client(get_secret("SUPABASE_URL"), get_secret("SUPABASE_SERVICE_ROLE_KEY"))
-
-
-def get_pinecone():
-    pc = Pinecone(api_key=get_secret("PINECONE_API_KEY"))
-    return pc.Index(get_secret("PINECONE_INDEX_NAME"))
-
-
-class DocumentTypeResult(BaseModel):
-    doc_type: Literal[
-        "building_code", "engineering_report", "textbook", "specification", "drawing", "general_pdf"
-    ]
-    requires_section_parsing: bool = Field(
-        description="True if this document type contains numbered code sections"
-    )
-
-
-class SectionExtractionResult(BaseModel):
-    main_sections: List[str] = Field(default_factory=list)
-    reference_sections: List[str] = Field(default_factory=list)
-
-
-def classify_document_type(sample_text: str):
-    client = OpenAI(api_key=get_secret("OPENAI_API_KEY"))
-
-    schema = DocumentTypeResult.model_json_schema()
-
-    prompt = f"""
-    Classify the document based on the sample text.
-    Return ONLY a JSON object following the schema.
-    
-    Sample: {sample_text}
-    """
-
-    out = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[{"role": "user", "content": prompt}],
-        response_format={
-            "type": "json_schema",
-            "json_schema": {"name": "doc_type_result", "schema": schema},
-        },
+import bisect
+import itertools
+from nya_basic_chat.clients import get_openai, get_supabase
+from nya_basic_chat.rag.blobs import get_blob_store
+from nya_basic_chat.rag.cache import bump_namespace, get_embedding_cache
+from nya_basic_chat.rag.chunk_store import forget_chunks, remember_chunks
+from nya_basic_chat.rag.classify import classify_document_type
+from nya_basic_chat.rag.embedder import EMBED_MODEL, embed_batched, get_encoding
+from nya_basic_chat.rag.extract import iter_pages
+from nya_basic_chat.rag.pipeline import run_pipeline
+from nya_basic_chat.rag.section_index import section_rows
+from nya_basic_chat.rag.sections import fallback_extract_sections, scan_sections
+from nya_basic_chat.rag.vectorstore import get_vector_store
+from nya_basic_chat.rag.writer import ChunkRowWriter, select_all
+
+# Sliding-window size and overlap, in tokens
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 250
+# Chunks scanned for section numbers together, so LLM fallbacks can be batched
+SECTION_BATCH_SIZE = 32
+# Chunks handed to embed_text at a time; it splits them into concurrent token-budgeted requests
+EMBED_BATCH_SIZE = 128
+# Max items buffered between two pipeline stages; bounds peak memory
+PIPELINE_QUEUE_SIZE = 4
+
+
+def iter_text(file_bytes, on_page_count=None, start_page=1, end_page=None):
+    """Yield `{page, text}` dicts one page at a time."""
+    return iter_pages(
+        file_bytes, on_page_count=on_page_count, start_page=start_page, end_page=end_page
     )
 
-    raw = out.choices[0].message.content
-    parsed_json = json.loads(raw)
-    parsed: DocumentTypeResult = DocumentTypeResult(**parsed_json)
-    return parsed.doc_type, parsed.requires_section_parsing
-
-
-def extract_main_sections(chunk: str):
-    """Return all top-level section numbers that appear at line starts."""
-    MAIN_SECTION_REGEX = r"(?m)^(?P<section>\d{1,3}(?:\.\d+){1,6})"
-    return list({m.group("section") for m in re.finditer(MAIN_SECTION_REGEX, chunk)})
-
-
-def extract_reference_sections(chunk: str, main_sections: list[str]):
-    """Return all code references that are not the main headings."""
-    REF_SECTION_REGEX = r"\b(\d{1,3}(?:\.\d+){1,6})\b"
-    refs = re.findall(REF_SECTION_REGEX, chunk)
-    refs = {r for r in refs if r not in main_sections}
-    return list(refs)
-
-
-def fallback_extract_sections_with_llm(chunk: str):
-    client = OpenAI(api_key=get_secret("OPENAI_API_KEY"))
-    schema = SectionExtractionResult.model_json_schema()
-    prompt = f"""
-    Identify ALL building code sections in this chunk.
-    - main_sections: sections introduced in this chunk (top-level headings)
-    - reference_sections: sections referenced but not introduced
-    Text:
-    {chunk}
-    """
-    out = client.chat.completions.create(
-        model="gpt-5-nano",
-        messages=[{"role": "user", "content": prompt}],
-        response_format={
-            "type": "json_schema",
-            "json_schema": {"name": "doc_sections", "schema": schema},
-        },
-    )
-
-    raw = out.choices[0].message.content
-    parsed_json = json.loads(raw)
-    parsed: SectionExtractionResult = SectionExtractionResult(**parsed_json)
-    return parsed.main_sections, parsed.reference_sections
-
 
 def extract_text(file_bytes):
-    if isinstance(file_bytes, bytes):
-        file_bytes = io.BytesIO(file_bytes)
-
-    reader = PdfReader(file_bytes)
-    out = []
+    return list(iter_text(file_bytes))
 
-    for page_number, page in enumerate(reader.pages, start=1):
-        text = page.extract_text() or ""
-        out.append({"page": page_number, "text": text.strip()})
 
-    return out
-
-
-def chunk_text(text, chunk_size=1500, overlap=250):
-    enc = tiktoken.get_encoding("cl100k_base")
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    enc = get_encoding()
     tokens = enc.encode(text)
 
     chunks = []
@@ -128,95 +49,412 @@ def chunk_text(text, chunk_size=1500, overlap=250):
     return chunks
 
 
-def embed_text(chunks):
-    client = OpenAI(api_key=get_secret("OPENAI_API_KEY"))
-    response = client.embeddings.create(model="text-embedding-3-small", input=chunks)
-    return [r.embedding for r in response.data]
-
-
-def ingest_file(attachment_row):
-    sb = get_supabase()
-
-    try:
-        file_bytes = attachment_row["file_bytes"]
-
-        elements = extract_text(file_bytes)
+def embed_text(chunks, token_counts=None):
+    """
+    Embed chunks, sending only those missing from the embedding cache to OpenAI.
 
-        sample_text = elements[0]["text"][:2000]
-        doc_type, requires_parsing = classify_document_type(sample_text)
+    `token_counts`, aligned with `chunks`, saves tokenizing them again to size requests.
+    """
+    cache = get_embedding_cache()
+    out = cache.get_many(EMBED_MODEL, chunks)
+
+    misses = [i for i, emb in enumerate(out) if emb is None]
+    if misses:
+        texts = [chunks[i] for i in misses]
+        counts = [token_counts[i] for i in misses] if token_counts is not None else None
+        fresh = embed_batched(get_openai(), texts, model=EMBED_MODEL, token_counts=counts)
+        cache.put_many(EMBED_MODEL, texts, fresh)
+        for i, emb in zip(misses, fresh):
+            out[i] = emb
 
-        page_chunks = []  # will hold dicts {page, chunk}
-        num_pages = len(elements)
+    return out
 
-        for i in range(num_pages):
-            first_page = elements[i]["page"]
-            merged_text = elements[i]["text"]
 
-            if i < num_pages - 1:
-                merged_text += "\n" + elements[i + 1]["text"]
+# ---------- ingestion pipeline stages ----------
+# Each stage consumes an iterable from the previous stage and yields items for the
+# next one, so run_pipeline can overlap extraction, chunking, embedding and upserts.
 
-            chs = chunk_text(merged_text)
 
-            for ch in chs:
-                page_chunks.append({"page": first_page, "chunk": ch})
+def _chunk_pages(
+    pages, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, start_index=0, start_offset=0
+):
+    """
+    Slide one token window over the whole document as pages arrive.
 
-        embeddings = embed_text([pc["chunk"] for pc in page_chunks])
-        index = get_pinecone()
+    Each page is tokenized once. A table of page start offsets maps every window
+    back to the page its first token came from, and tokens that no window can
+    reach any more are dropped, so memory stays bounded by one window.
 
-        namespace = (
-            "global"
-            if attachment_row.get("category") == "global_perm"
-            else str(attachment_row["user_id"])
+    To resume, pass pages from the page a checkpoint recorded, that page's absolute
+    token offset as `start_offset`, and the first chunk index still to produce as
+    `start_index`; chunks come out identical to those of an uninterrupted run.
+    """
+    enc = get_encoding()
+    step = chunk_size - overlap
+
+    buffer = []  # tokens not yet slid past
+    buf_start = start_offset  # absolute offset of buffer[0]
+    skip_to = start_index * step  # absolute offset of the first window to emit
+    # absolute offset just past the last emitted window
+    emitted_end = (start_index - 1) * step + chunk_size if start_index else 0
+    page_offsets, page_numbers = [], []
+    index = start_index
+
+    def emit(window_tokens):
+        nonlocal index, emitted_end
+        i = bisect.bisect_right(page_offsets, buf_start) - 1
+        chunk = {
+            "index": index,
+            "page": page_numbers[i],
+            "page_offset": page_offsets[i],
+            "chunk": enc.decode(window_tokens),
+            "tokens": len(window_tokens),
+        }
+        index += 1
+        emitted_end = buf_start + len(window_tokens)
+        return chunk
+
+    for page in pages:
+        # Pages are joined with a newline; only the document's first page goes without
+        text = page["text"] if page["page"] == 1 else "\n" + page["text"]
+        page_offsets.append(buf_start + len(buffer))
+        page_numbers.append(page["page"])
+        buffer.extend(enc.encode(text, disallowed_special=()))
+
+        if buf_start < skip_to:
+            drop = min(len(buffer), skip_to - buf_start)
+            del buffer[:drop]
+            buf_start += drop
+
+        while len(buffer) >= chunk_size:
+            yield emit(buffer[:chunk_size])
+            del buffer[:step]
+            buf_start += step
+
+    if buffer and buf_start + len(buffer) > emitted_end:
+        yield emit(buffer)
+
+
+def _annotate_sections(chunks, requires_parsing, batch_size=SECTION_BATCH_SIZE):
+    """Tag chunks with section numbers, a batch at a time so LLM fallbacks are grouped."""
+    batch = []
+    for c in chunks:
+        batch.append(c)
+        if len(batch) >= batch_size:
+            yield from _annotate_batch(batch, requires_parsing)
+            batch = []
+    if batch:
+        yield from _annotate_batch(batch, requires_parsing)
+
+
+def _annotate_batch(batch, requires_parsing):
+    for c in batch:
+        c["main_sections"], c["reference_sections"] = (
+            scan_sections(c["chunk"]) if requires_parsing else ([], [])
         )
 
-        pinecone_vectors = []
-        for i, (pc, emb) in enumerate(zip(page_chunks, embeddings)):
-            chunk_id = f"{attachment_row['id']}_chunk_{i}"
-            chunk_text_val = pc["chunk"]
+    misses = [c for c in batch if requires_parsing and not c["main_sections"]]
+    if misses:
+        sections = fallback_extract_sections([c["chunk"] for c in misses])
+        for c, (main_secs, ref_secs) in zip(misses, sections):
+            c["main_sections"], c["reference_sections"] = main_secs, ref_secs
+    return batch
 
-            main_secs, ref_secs = [], []
-            if requires_parsing:
-                main_secs = extract_main_sections(chunk_text_val)
-                ref_secs = extract_reference_sections(chunk_text_val, main_secs)
 
-                if not main_secs:
-                    main_secs, ref_secs = fallback_extract_sections_with_llm(chunk_text_val)
+def _embed_batches(chunks, state, batch_size=EMBED_BATCH_SIZE):
+    """
+    Group chunks into batches and attach an embedding to each chunk.
 
-            sb.table("chunks").upsert(
-                {
-                    "id": chunk_id,
-                    "attachment_id": attachment_row["id"],
-                    "page_number": pc["page"],
-                    "chunk_index": i,
-                    "content": chunk_text_val,
-                    "main_sections": main_secs,
-                    "reference_sections": ref_secs,
-                }
-            ).execute()
+    Batch `n` always holds chunk indexes `n * batch_size` up to the next multiple,
+    so batch numbers in a checkpoint stay valid for a resumed run.
+    """
+    batch = []
+    for c in chunks:
+        if batch and c["index"] // batch_size != batch[0]["index"] // batch_size:
+            yield _embed_batch(batch, state, batch_size)
+            batch = []
+        batch.append(c)
+    if batch:
+        yield _embed_batch(batch, state, batch_size)
+
+
+def _embed_batch(batch, state, batch_size):
+    embeddings = embed_text([c["chunk"] for c in batch], [c["tokens"] for c in batch])
+    for c, emb in zip(batch, embeddings):
+        c["embedding"] = emb
+    state["last_embedded_batch"] = batch[0]["index"] // batch_size
+    return batch
+
+
+def _track_pages(pages, state):
+    for page in pages:
+        yield page
+        state["last_extracted_page"] = page["page"]
+
+
+def _upsert_batches(batches, sb, store, attachment_row, doc_type, namespace, state):
+    """Write chunk rows, section entries and vectors for each batch, checkpointing after each."""
+    writer = ChunkRowWriter(sb)
+    index_writer = ChunkRowWriter(sb, table="section_index")
+    for batch in batches:
+        rows, vectors = [], []
+        for c in batch:
+            row = _chunk_row(
+                attachment_row["id"],
+                c["index"],
+                c["page"],
+                c["chunk"],
+                c["main_sections"],
+                c["reference_sections"],
+            )
+            writer.add(row)
+            rows.append(row)
+            for r in section_rows(row, attachment_row, namespace):
+                index_writer.add(r)
 
             metadata = {
                 "attachment_id": str(attachment_row["id"]),
                 "file_name": attachment_row["file_name"],
-                "page_number": pc["page"],
-                "chunk_index": i,
+                "page_number": c["page"],
+                "chunk_index": c["index"],
                 "doc_type": doc_type,
-                "main_sections": main_secs,
-                "reference_sections": ref_secs,
+                "main_sections": c["main_sections"],
+                "reference_sections": c["reference_sections"],
                 "category": attachment_row["category"],
             }
 
-            pinecone_vectors.append(
+            vectors.append(
                 {
-                    "id": chunk_id,
-                    "values": emb,
+                    "id": row["id"],
+                    "values": c["embedding"],
                     "metadata": metadata,
                 }
             )
 
-        # batch upsert to Pinecone
-        # Pinecone has a limit of 50 vectors per upsert
-        for i in range(0, len(pinecone_vectors), 50):
-            index.upsert(vectors=pinecone_vectors[i : i + 50], namespace=namespace)
+        # Rows must exist before their vectors or section entries can be returned by retrieval
+        writer.flush()
+        index_writer.flush()
+        remember_chunks(rows)
+
+        store.upsert(vectors, namespace)
+        bump_namespace(sb, namespace)
+
+        # Everything up to this batch is stored; a resume restarts from its last chunk's page
+        last = batch[-1]
+        state["chunks_done"] = state.get("chunks_done", 0) + len(batch)
+        state.update(
+            last_upserted_batch=last["index"] // EMBED_BATCH_SIZE,
+            resume_chunk_index=last["index"] + 1,
+            resume_page=last["page"],
+            resume_token_offset=last["page_offset"],
+            pages_done=last["page"],
+        )
+        _save_checkpoint(sb, attachment_row["id"], state)
+
+        yield len(batch)
+
+
+# Columns of attachment_processing_status that hold ingestion progress and checkpoints
+CHECKPOINT_FIELDS = (
+    "total_pages",
+    "pages_done",
+    "chunks_done",
+    "last_extracted_page",
+    "last_embedded_batch",
+    "last_upserted_batch",
+    "resume_chunk_index",
+    "resume_page",
+    "resume_token_offset",
+)
+
+
+def _save_checkpoint(sb, attachment_id, state):
+    sb.table("attachment_processing_status").update(
+        {
+            **{k: state.get(k) for k in CHECKPOINT_FIELDS},
+            "last_updated": datetime.utcnow().isoformat(),
+        }
+    ).eq("attachment_id", attachment_id).execute()
+
+
+def get_namespace(attachment_row):
+    return (
+        "global"
+        if attachment_row.get("category") == "global_perm"
+        else str(attachment_row["user_id"])
+    )
+
+
+def _chunk_row(attachment_id, chunk_index, page_number, content, main_secs, ref_secs):
+    return {
+        "id": f"{attachment_id}_chunk_{chunk_index}",
+        "attachment_id": attachment_id,
+        "page_number": page_number,
+        "chunk_index": chunk_index,
+        "content": content,
+        "main_sections": main_secs,
+        "reference_sections": ref_secs,
+    }
+
+
+def find_ingested_duplicate(sb, attachment_row):
+    """Return another ready attachment with the same content hash, if there is one."""
+    sha256 = attachment_row.get("content_sha256")
+    if not sha256:
+        return None
+
+    rows = (
+        sb.table("attachments")
+        .select("*")
+        .eq("content_sha256", sha256)
+        .neq("id", attachment_row["id"])
+        .execute()
+        .data
+    )
+    if not rows:
+        return None
+
+    ready = (
+        sb.table("attachment_processing_status")
+        .select("attachment_id")
+        .in_("attachment_id", [r["id"] for r in rows])
+        .eq("status", "ready")
+        .execute()
+        .data
+    )
+    ready_ids = {r["attachment_id"] for r in ready}
+    for r in rows:
+        if r["id"] in ready_ids:
+            return r
+    return None
+
+
+def link_duplicate(sb, attachment_row, source_row):
+    """Copy the chunk rows and vectors of an already ingested upload to a new attachment."""
+    store = get_vector_store()
+    source_ns = get_namespace(source_row)
+    namespace = get_namespace(attachment_row)
+
+    rows = select_all(
+        sb.table("chunks").select("*").eq("attachment_id", source_row["id"]).order("chunk_index")
+    )
+
+    copies = [
+        _chunk_row(
+            attachment_row["id"],
+            r["chunk_index"],
+            r["page_number"],
+            r["content"],
+            r["main_sections"],
+            r["reference_sections"],
+        )
+        for r in rows
+    ]
+    with ChunkRowWriter(sb) as writer:
+        for row in copies:
+            writer.add(row)
+    with ChunkRowWriter(sb, table="section_index") as index_writer:
+        for row in copies:
+            for r in section_rows(row, attachment_row, namespace):
+                index_writer.add(r)
+    remember_chunks(copies)
+
+    for i in range(0, len(rows), 100):
+        part = rows[i : i + 100]
+        fetched = store.fetch([r["id"] for r in part], source_ns)
+        vectors = []
+        for r in part:
+            v = fetched.get(r["id"])
+            if v is None:
+                continue
+            vectors.append(
+                {
+                    "id": f"{attachment_row['id']}_chunk_{r['chunk_index']}",
+                    "values": list(v.values),
+                    "metadata": {
+                        **v.metadata,
+                        "attachment_id": str(attachment_row["id"]),
+                        "file_name": attachment_row["file_name"],
+                        "category": attachment_row["category"],
+                    },
+                }
+            )
+        store.upsert(vectors, namespace)
+    bump_namespace(sb, namespace)
+
+
+def _ingest(sb, attachment_row, file_bytes, resume=None, stats=None):
+    attachment_id = attachment_row["id"]
+    state = {}
+    start_index, start_page, start_offset = 0, 1, 0
+    if resume and resume.get("resume_chunk_index") is not None:
+        state = {k: resume.get(k) for k in CHECKPOINT_FIELDS}
+        start_index = resume["resume_chunk_index"]
+        start_page = resume["resume_page"]
+        start_offset = resume["resume_token_offset"]
+
+    def on_page_count(n):
+        state["total_pages"] = n
+
+    # Classification needs the first page before chunking starts
+    if start_page == 1:
+        pages = iter_text(file_bytes, on_page_count=on_page_count)
+        first_page = next(pages, None)
+        pages = itertools.chain([first_page] if first_page else [], pages)
+    else:
+        first_page = next(iter_text(file_bytes, end_page=1), None)
+        pages = iter_text(file_bytes, on_page_count=on_page_count, start_page=start_page)
+    sample_text = first_page["text"][:2000] if first_page else ""
+    doc_type, requires_parsing = classify_document_type(sample_text)
+
+    store = get_vector_store()
+    namespace = get_namespace(attachment_row)
+
+    # A fresh run clears any checkpoint left by an earlier attempt; a resume re-saves its own
+    _save_checkpoint(sb, attachment_id, state)
+
+    try:
+        # extract -> chunk -> sections -> embed -> upsert, joined by bounded queues
+        run_pipeline(
+            _track_pages(pages, state),
+            lambda pages: _chunk_pages(pages, start_index=start_index, start_offset=start_offset),
+            lambda chunks: _annotate_sections(chunks, requires_parsing),
+            lambda chunks: _embed_batches(chunks, state),
+            lambda batches: _upsert_batches(
+                batches, sb, store, attachment_row, doc_type, namespace, state
+            ),
+            maxsize=PIPELINE_QUEUE_SIZE,
+            names=("extract", "chunk", "sections", "embed", "upsert"),
+            stats=stats,
+        )
+    except Exception:
+        _save_checkpoint(sb, attachment_id, state)
+        raise
+
+
+def ingest_file(attachment_row, dedup=True, resume=None, stats=None):
+    """
+    Ingest an attachment into the chunks table and the vector index.
+
+    The bytes come from `file_bytes` or, when absent, from the blob store via
+    `content_sha256`. With `dedup`, an upload whose hash matches an attachment that
+    is already ready reuses its chunks and vectors instead of being parsed again.
+
+    Progress and checkpoints are written to the attachment's status row after every
+    upserted batch. Pass that row as `resume` to continue from its checkpoint.
+    A `stats` dict, if given, receives per-stage timings from the pipeline.
+    """
+    sb = get_supabase()
+
+    try:
+        source_row = find_ingested_duplicate(sb, attachment_row) if dedup and not resume else None
+        if source_row:
+            link_duplicate(sb, attachment_row, source_row)
+        else:
+            file_bytes = attachment_row.get("file_bytes")
+            if file_bytes is None:
+                file_bytes = get_blob_store().get(attachment_row["content_sha256"])
+            _ingest(sb, attachment_row, file_bytes, resume, stats)
 
         sb.table("attachment_processing_status").upsert(
             {
@@ -236,3 +474,39 @@ def ingest_file(attachment_row):
             }
         ).execute()
         raise
+
+
+def reindex_attachment(attachment_id):
+    """Rebuild an attachment's chunks and vectors from its stored original upload."""
+    sb = get_supabase()
+    store = get_vector_store()
+
+    row = sb.table("attachments").select("*").eq("id", attachment_id).single().execute().data
+
+    stale = select_all(
+        sb.table("chunks").select("id").eq("attachment_id", attachment_id).order("id")
+    )
+    stale_ids = [c["id"] for c in stale]
+    store.delete(stale_ids, get_namespace(row))
+    bump_namespace(sb, get_namespace(row))
+    forget_chunks(stale_ids)
+    sb.table("chunks").delete().eq("attachment_id", attachment_id).execute()
+
+    ingest_file(row, dedup=False)
+
+
+def resume_ingest(attachment_id):
+    """Continue an interrupted ingestion from the checkpoint on its status row."""
+    sb = get_supabase()
+    row = sb.table("attachments").select("*").eq("id", attachment_id).single().execute().data
+    status = (
+        sb.table("attachment_processing_status")
+        .select("*")
+        .eq("attachment_id", attachment_id)
+        .single()
+        .execute()
+        .data
+    )
+    if status["status"] == "ready":
+        return
+    ingest_file(row, dedup=False, resume=status)
@@ -1,70 +1,160 @@
-from openai import OpenAI
-from pinecone import Pinecone
-from nya_basic_chat.config import get_secret
-from nya_basic_chat.rag.processor import get_supabase
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+from nya_basic_chat.clients import get_openai, get_supabase
+from nya_basic_chat.rag.cache import TTLCache, namespace_versions
+from nya_basic_chat.rag.chunk_store import get_chunks
+from nya_basic_chat.rag.context import (
+    CONTEXT_MAX_TOKENS,
+    assemble_context,
+    extend_context,
+    format_context,
+)
+from nya_basic_chat.rag.planner import QuerySpec, plan_queries, run_queries
+from nya_basic_chat.rag.section_index import find_section_chunks, find_sections
+from nya_basic_chat.rag.vectorstore import get_vector_store
+from nya_basic_chat.tracing import bind, span
+
+QUERY_EMBED_MODEL = "text-embedding-3-small"
+
+# Top excerpts whose cited sections are added to the context, and the most sections followed
+REFERENCE_EXPANSION_HITS = 3
+REFERENCE_EXPANSION_MAX_SECTIONS = 12
+
+# Query embeddings keyed by model and normalized prompt text
+_query_embeddings = TTLCache(max_entries=2048, ttl=3600)
+# Vector query results keyed by namespace version, filter, top_k and query vector
+_query_results = TTLCache(max_entries=1024, ttl=600)
+
+
+def _normalize_query(text):
+    return " ".join(text.split()).casefold()
 
 
 def embed_query(text):
-    client = OpenAI(api_key=get_secret("OPENAI_API_KEY"))
-    response = client.embeddings.create(model="text-embedding-3-small", input=[text])
-    return response.data[0].embedding
+    key = (QUERY_EMBED_MODEL, _normalize_query(text))
+    embedding = _query_embeddings.get(key)
+    with span("rag.embed_query", cached=embedding is not None):
+        if embedding is None:
+            response = get_openai().embeddings.create(model=QUERY_EMBED_MODEL, input=[text])
+            embedding = response.data[0].embedding
+            _query_embeddings.put(key, embedding)
+    return embedding
 
 
-def retrieve_chunks(user_id, file_ids, prompt, top_k=8):
-    pc = Pinecone(api_key=get_secret("PINECONE_API_KEY"))
-    index = pc.Index(get_secret("PINECONE_INDEX_NAME"))
-    sb = get_supabase()
+def cached_query(versions, store, vector, namespace, filter=None, top_k=10):
+    """
+    `store.query` behind the result cache.
+
+    The key includes the namespace's version from `versions` (see namespace_versions),
+    which ingestion and cleanup bump whenever they change its vectors, so entries from
+    before a change are not hit (after NAMESPACE_VERSION_TTL when the change was made
+    by another process).
+    """
+    key = (
+        namespace,
+        versions[namespace],
+        json.dumps(filter, sort_keys=True),
+        top_k,
+        hashlib.sha256(array("f", vector).tobytes()).hexdigest(),
+    )
+    matches = _query_results.get(key)
+    with span("rag.vector_query", namespace=namespace, top_k=top_k, cached=matches is not None):
+        if matches is None:
+            matches = store.query(vector, namespace, filter=filter, top_k=top_k)
+            _query_results.put(key, matches)
+    return list(matches)
+
+
+def _expand_references(sb, excerpts, user_id, file_ids, max_tokens):
+    """Add the sections cited by the top excerpts, one level deep, in one batched lookup."""
+    refs = []
+    for e in excerpts[:REFERENCE_EXPANSION_HITS]:
+        refs += e.references
+    refs = list(dict.fromkeys(refs))[:REFERENCE_EXPANSION_MAX_SECTIONS]
+    with span("rag.expand_references", sections=len(refs)) as s:
+        matches = find_sections(sb, refs, user_id, file_ids)
+        if matches:
+            extend_context(excerpts, matches, get_chunks(sb, [m.id for m in matches]), max_tokens)
+        s.set(chunks=len(matches), excerpts=len(excerpts))
+    return excerpts
 
-    query_emb = embed_query(prompt)
 
-    personal_perm = index.query(
-        vector=query_emb,
-        namespace=str(user_id),
-        filter={"category": "personal_perm"},
-        top_k=top_k,
-        include_metadata=True,
-    ).matches
+def retrieve_context(
+    user_id,
+    file_ids,
+    prompt,
+    top_k=8,
+    max_tokens=CONTEXT_MAX_TOKENS,
+    expand_references=True,
+):
+    """
+    Return the excerpts to inject for `prompt`, best first, within `max_tokens`.
 
+    Up to `top_k` candidates come from each of the user's permanent files, the
+    selected temporary files and the global library; assemble_context then ranks,
+    deduplicates and trims them. Prompts that cite indexed sections (e.g. "Section
+    4.2" or 1613.2.1) are answered from the section index instead, with no embedding
+    call. Bare decimals that happen to match an indexed heading ("1.5 safety factor")
+    only add that heading's chunk after the semantic results, budget permitting.
+    With `expand_references`, sections cited by the top excerpts are appended while
+    the token budget allows.
+    """
+    with span("rag.retrieve", top_k=top_k, temp_files=len(file_ids or [])) as s:
+        excerpts = _retrieve(user_id, file_ids, prompt, top_k, max_tokens)
+        if expand_references and excerpts:
+            _expand_references(get_supabase(), excerpts, user_id, file_ids, max_tokens)
+        s.set(excerpts=len(excerpts), tokens=sum(e.tokens for e in excerpts))
+    return excerpts
+
+
+def _retrieve(user_id, file_ids, prompt, top_k, max_tokens):
+    store = get_vector_store()
+    sb = get_supabase()
+
+    with span("rag.section_lookup") as s:
+        hits, mentions = find_section_chunks(sb, prompt, user_id, file_ids)
+        s.set(hits=len(hits), mentions=len(mentions))
+    if hits:
+        rows_by_id = get_chunks(sb, [m.id for m in hits])
+        with span("rag.assemble", candidates=len(hits)):
+            return assemble_context(hits, rows_by_id, max_tokens=max_tokens)
+
+    specs = [QuerySpec(str(user_id), {"category": "personal_perm"}, top_k)]
     if file_ids:
-        personal_temp = index.query(
-            vector=query_emb,
-            namespace=str(user_id),
-            filter={
-                "attachment_id": {"$in": file_ids},
-                "category": "personal_temp",
-            },
-            top_k=top_k,
-            include_metadata=True,
-        ).matches
-    else:
-        personal_temp = []
-
-    global_perm = index.query(
-        vector=query_emb,
-        namespace="global",
-        filter={"category": "global_perm"},
-        top_k=top_k,
-        include_metadata=True,
-    ).matches
-
-    results = personal_perm + personal_temp + global_perm
-
-    chunk_ids = [match.id for match in results]
-    if len(chunk_ids) == 0:
-        return ""
-
-    rows = sb.table("chunks").select("*").in_("id", chunk_ids).execute().data
-
-    # Build excerpt output
-    out = []
-    rows_by_id = {r["id"]: r for r in rows}
-
-    for m in results:
-        r = rows_by_id.get(m.id)
-        if not r:
-            continue
-        out.append(
-            f"Source: [{m.metadata.get('file_name')} - Page {r['page_number']}]\nContent:\n{r['content']}"
+        specs.append(
+            QuerySpec(
+                str(user_id),
+                {"attachment_id": {"$in": sorted(file_ids)}, "category": "personal_temp"},
+                top_k,
+            )
         )
+    specs.append(QuerySpec("global", {"category": "global_perm"}, top_k))
+    # Both personal queries become one $or query
+    plan = plan_queries(specs)
+
+    # The versions keying the result cache are read in one query, alongside the embedding
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(bind(namespace_versions), sb, [q.namespace for q in plan])
+        query_emb = embed_query(prompt)
+        versions = pending.result()
+
+    # Namespaces and chunk lookups overlap
+    results, rows_by_id = run_queries(
+        lambda *args, **kwargs: cached_query(versions, store, *args, **kwargs),
+        query_emb,
+        plan,
+        fetch=lambda ids: get_chunks(sb, ids),
+    )
+    with span("rag.assemble", candidates=len(results)):
+        excerpts = assemble_context(results, rows_by_id, max_tokens=max_tokens, file_ids=file_ids)
+    if mentions:
+        # Possibly just a number in the question; never displaces a semantic match
+        extend_context(excerpts, mentions, get_chunks(sb, [m.id for m in mentions]), max_tokens)
+    return excerpts
+
 
-    return "\n".join(out)
+def retrieve_chunks(user_id, file_ids, prompt, top_k=8, max_tokens=CONTEXT_MAX_TOKENS):
+    """Return the retrieved excerpts formatted for the system prompt ("" if none)."""
+    return format_context(retrieve_context(user_id, file_ids, prompt, top_k, max_tokens))
@@ -0,0 +1,20 @@
+import random
+import time
+
+
+def with_retries(fn, attempts=3, backoff=0.5, retry_on=(Exception,), retry_if=None):
+    """
+    Call `fn()` and retry it with exponential backoff and jitter on failure.
+
+    Only `retry_on` errors are retried, and with `retry_if` only those it returns
+    True for; anything else is raised at once.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except retry_on as e:
+            if attempt == attempts or (retry_if is not None and not retry_if(e)):
+                raise
+            delay = backoff * 2 ** (attempt - 1) + random.uniform(0, backoff)
+            print(f"Retrying in {delay:.1f}s after error ({attempt}/{attempts}):", e)
+            time.sleep(delay)
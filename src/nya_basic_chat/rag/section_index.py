@@ -0,0 +1,138 @@
+import re
+from nya_basic_chat.rag.cache import TTLCache, namespace_versions
+from nya_basic_chat.rag.sections import SECTION_REGEX
+from nya_basic_chat.rag.vectorstore import Match
+
+# Score given to exact section hits, above any cosine similarity
+SECTION_HIT_SCORE = 1.0
+# Most section numbers looked up for one prompt
+MAX_PROMPT_SECTIONS = 8
+# Words that introduce a number as a section citation ("Section 4.2", "Sec. 4.2", "§ 4.2")
+_CITATION_PREFIX = re.compile(r"(?:\bsections?|\bsec\.|§)\s*$", re.IGNORECASE)
+
+# (namespace, namespace version, section) -> section_index rows
+_memo = TTLCache(max_entries=4096, ttl=600)
+
+
+def section_rows(chunk_row, attachment_row, namespace):
+    """
+    Return the section_index rows for one chunk row, one per heading it introduces.
+
+    Citations are not indexed: lookups only ever want the chunk that introduces a
+    section, and the cited sections stay on the chunk row for reference expansion.
+    """
+    return [
+        {
+            "section": s,
+            "chunk_id": chunk_row["id"],
+            "attachment_id": str(attachment_row["id"]),
+            "namespace": namespace,
+            "category": attachment_row["category"],
+            "file_name": attachment_row["file_name"],
+            "is_main": True,
+        }
+        for s in dict.fromkeys(chunk_row.get("main_sections") or [])
+    ]
+
+
+def _is_citation(prompt, m):
+    number = m.group()
+    if number.count(".") >= 2 or len(number.split(".")[0]) >= 3:
+        return True
+    return _CITATION_PREFIX.search(prompt[max(0, m.start() - 12) : m.start()]) is not None
+
+
+def sections_in(prompt):
+    """
+    Return `(cited, mentioned)` section numbers in a prompt, in order of appearance.
+
+    A number is cited when it is introduced as a section or has code-style depth
+    (1613.2.1, or a 3-4 digit lead as in 1607.3). Other numbers matching the
+    section pattern, such as "1.5 safety factor" or "12.5 ft", are only mentioned.
+    """
+    cited, mentioned = {}, {}
+    for m in SECTION_REGEX.finditer(prompt):
+        (cited if _is_citation(prompt, m) else mentioned)[m.group()] = None
+    mentioned = [n for n in mentioned if n not in cited]
+    return list(cited)[:MAX_PROMPT_SECTIONS], mentioned[: MAX_PROMPT_SECTIONS - len(cited)]
+
+
+def _lookup(sb, namespaces, sections):
+    """
+    section_index rows for the sections in the namespaces, in one query for all misses.
+
+    Results are memoized per (namespace, namespace version, section).
+    """
+    found, missing = [], {}
+    versions = namespace_versions(sb, namespaces)
+    for ns, version in versions.items():
+        for s in sections:
+            rows = _memo.get((ns, version, s))
+            if rows is None:
+                missing[(ns, s)] = []
+            else:
+                found.extend(rows)
+    if not missing:
+        return found
+
+    rows = (
+        sb.table("section_index")
+        .select("section, chunk_id, attachment_id, namespace, category, file_name, is_main")
+        .in_("namespace", sorted({ns for ns, _ in missing}))
+        .in_("section", sorted({s for _, s in missing}))
+        .execute()
+        .data
+    )
+    for r in rows:
+        # The query spans every missing namespace and section; skip pairs already memoized
+        hits = missing.get((r["namespace"], r["section"]))
+        if hits is not None:
+            hits.append(r)
+    for (ns, s), hits in missing.items():
+        _memo.put((ns, versions[ns], s), hits)
+        found.extend(hits)
+    return found
+
+
+def find_sections(sb, sections, user_id, file_ids):
+    """
+    Return matches for the chunks that introduce `sections`, in one batched lookup.
+
+    Only chunks the semantic search could also return are considered: the user's
+    permanent files, the selected temporary files and the global library.
+    """
+    if not sections:
+        return []
+    return _matches(_lookup(sb, [str(user_id), "global"], sections), file_ids)
+
+
+def _matches(rows, file_ids):
+    allowed_temp = {str(f) for f in file_ids or []}
+    matches = {}
+    for r in rows:
+        if not r["is_main"]:
+            continue
+        if r["category"] == "personal_temp" and r["attachment_id"] not in allowed_temp:
+            continue
+        matches.setdefault(
+            r["chunk_id"],
+            Match(r["chunk_id"], SECTION_HIT_SCORE, {"file_name": r["file_name"]}),
+        )
+    return list(matches.values())
+
+
+def find_section_chunks(sb, prompt, user_id, file_ids):
+    """
+    Return `(cited, mentioned)` matches for the section numbers in `prompt`.
+
+    Both come from one lookup; either is empty when none of its numbers is indexed.
+    """
+    cited, mentioned = sections_in(prompt)
+    if not cited and not mentioned:
+        return [], []
+    rows = _lookup(sb, [str(user_id), "global"], cited + mentioned)
+    cited = set(cited)
+    return (
+        _matches([r for r in rows if r["section"] in cited], file_ids),
+        _matches([r for r in rows if r["section"] not in cited], file_ids),
+    )
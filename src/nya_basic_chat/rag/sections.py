@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import re
+import threading
+from typing import List
+from pydantic import BaseModel, Field
+from nya_basic_chat.clients import get_openai
+from nya_basic_chat.rag.cache import JsonCache, text_hash
+
+# Section numbers such as 4.2, 1613.2.1 or 11.3.5.2.1
+SECTION_REGEX = re.compile(r"\b\d{1,4}(?:\.\d+){1,6}\b")
+
+# Chunks sent together in one fallback LLM call, and fallback calls in flight
+FALLBACK_BATCH_SIZE = 8
+FALLBACK_WORKERS = 4
+
+
+class ChunkSections(BaseModel):
+    chunk: int = Field(description="Number of the chunk, as given in the prompt")
+    main_sections: List[str] = Field(default_factory=list)
+    reference_sections: List[str] = Field(default_factory=list)
+
+
+class BatchSectionExtractionResult(BaseModel):
+    results: List[ChunkSections]
+
+
+def scan_sections(chunk: str):
+    """
+    Return (main_sections, reference_sections) for a chunk in one regex pass.
+
+    Section numbers at the start of a line are headings introduced by the chunk;
+    every other section number that is not also a heading is a reference.
+    """
+    main, refs = {}, {}
+    for m in SECTION_REGEX.finditer(chunk):
+        start = m.start()
+        if start == 0 or chunk[start - 1] == "\n":
+            main[m.group()] = None
+        else:
+            refs[m.group()] = None
+    return list(main), [r for r in refs if r not in main]
+
+
+_fallback_cache = None
+_fallback_cache_lock = threading.Lock()
+
+
+def _get_fallback_cache():
+    global _fallback_cache
+    with _fallback_cache_lock:
+        if _fallback_cache is None:
+            _fallback_cache = JsonCache("sections")
+        return _fallback_cache
+
+
+def _extract_sections_llm(client, chunks):
+    schema = BatchSectionExtractionResult.model_json_schema()
+    numbered = "\n\n".join(f"--- Chunk {i} ---\n{c}" for i, c in enumerate(chunks))
+    prompt = f"""
+    Identify ALL building code sections in each of the numbered chunks below.
+    Return one result per chunk, using the chunk number.
+    - main_sections: sections introduced in this chunk (top-level headings)
+    - reference_sections: sections referenced but not introduced
+    {numbered}
+    """
+    out = client.chat.completions.create(
+        model="gpt-5-nano",
+        messages=[{"role": "user", "content": prompt}],
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "doc_sections_batch", "schema": schema},
+        },
+    )
+
+    raw = out.choices[0].message.content
+    parsed = BatchSectionExtractionResult(**json.loads(raw))
+    # Chunks the model left out are missing from the result, not empty
+    return {
+        r.chunk: (r.main_sections, r.reference_sections)
+        for r in parsed.results
+        if 0 <= r.chunk < len(chunks)
+    }
+
+
+def _extract_batch(client, chunks):
+    """
+    Return (main, refs) per chunk, or None for a chunk the model left out.
+
+    Chunks missing from a batched answer are asked about again one at a time.
+    """
+    found = _extract_sections_llm(client, chunks)
+    if len(chunks) > 1:
+        for i, chunk in enumerate(chunks):
+            if i not in found:
+                alone = _extract_sections_llm(client, [chunk])
+                if 0 in alone:
+                    found[i] = alone[0]
+    return [found.get(i) for i in range(len(chunks))]
+
+
+def fallback_extract_sections(chunks, batch_size=FALLBACK_BATCH_SIZE, workers=FALLBACK_WORKERS):
+    """
+    Ask the LLM for the sections of chunks the scanner found no headings in.
+
+    Results are cached by chunk hash. Uncached chunks are sent `batch_size` at a
+    time in concurrent structured-output calls. Returns (main, refs) per chunk;
+    chunks the model never answered for get empty lists and are not cached.
+    """
+    cache = _get_fallback_cache()
+    hashes = [text_hash(c) for c in chunks]
+    found = cache.get_many(hashes)
+
+    todo = list({h: c for h, c in zip(hashes, chunks) if h not in found}.items())
+    if todo:
+        client = get_openai()
+        batches = [todo[i : i + batch_size] for i in range(0, len(todo), batch_size)]
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            results = pool.map(lambda b: _extract_batch(client, [c for _, c in b]), batches)
+            fresh = {}
+            for batch, sections in zip(batches, results):
+                for (h, _), secs in zip(batch, sections):
+                    if secs is not None:
+                        fresh[h] = list(secs)
+        if fresh:
+            cache.put_many(fresh)
+        found.update(fresh)
+
+    return [tuple(found.get(h, ([], []))) for h in hashes]
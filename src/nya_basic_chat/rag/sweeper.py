@@ -0,0 +1,103 @@
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from nya_basic_chat.clients import get_supabase
+from nya_basic_chat.config import get_secret
+from nya_basic_chat.rag.cleanup import cleanup_expired_temp_files, cleanup_orphan_blobs
+
+# Seconds between sweeps of expired temporary files
+DEFAULT_SWEEP_INTERVAL = 3600
+LEASE_NAME = "temp_file_sweeper"
+
+# Identifies this process as a lease holder
+_holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _interval():
+    return int(get_secret("SWEEP_INTERVAL", DEFAULT_SWEEP_INTERVAL))
+
+
+def acquire_lease(sb, name=LEASE_NAME, ttl=None):
+    """
+    Take or renew the named lease for this process; return whether it is held.
+
+    The holder renews it before every sweep. Another process can only take it
+    once it has gone unrenewed for `ttl`, so exactly one live process sweeps.
+    """
+    ttl = ttl or timedelta(seconds=2 * _interval())
+    now = datetime.now(timezone.utc)
+    lease = {"name": name, "holder": _holder, "expires_at": (now + ttl).isoformat()}
+
+    renewed = (
+        sb.table("worker_leases").update(lease).eq("name", name).eq("holder", _holder).execute()
+    )
+    if renewed.data:
+        return True
+    taken = (
+        sb.table("worker_leases")
+        .update(lease)
+        .eq("name", name)
+        .lt("expires_at", now.isoformat())
+        .execute()
+    )
+    if taken.data:
+        return True
+    try:
+        sb.table("worker_leases").insert(lease).execute()
+        return True
+    except Exception:
+        # The lease row exists and is held by a live process
+        return False
+
+
+def sweep_once():
+    """
+    Delete expired temporary files for all users if this process holds the lease.
+
+    Blobs left orphaned inside their grace period by earlier deletes go too.
+    Returns how many files were deleted.
+    """
+    sb = get_supabase()
+    if not acquire_lease(sb):
+        return 0
+    deleted = cleanup_expired_temp_files()
+    cleanup_orphan_blobs()
+    return deleted
+
+
+def _run():
+    interval = _interval()
+    # Spread the first sweep so processes started together do not race for the lease
+    time.sleep(random.uniform(0, min(interval, 60)))
+    while True:
+        try:
+            deleted = sweep_once()
+            if deleted:
+                print("Expired temp files deleted:", deleted)
+        except Exception as e:
+            print("Error sweeping expired temp files:", e)
+        time.sleep(interval)
+
+
+def start_sweeper():
+    """Start the background sweeper thread once per process."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="temp-sweeper", daemon=True)
+            _thread.start()
+
+
+if __name__ == "__main__":
+    # One sweep, for running from cron instead of inside the app. The local vector store
+    # is held in memory by the app process, so deleting from its files here would leave
+    # the app writing from stale offsets; the app's own sweeper thread handles it.
+    if get_secret("VECTOR_STORE", "pinecone") == "local":
+        raise SystemExit("The cron sweeper needs VECTOR_STORE=pinecone; the app sweeps local")
+    print("Expired temp files deleted:", sweep_once())
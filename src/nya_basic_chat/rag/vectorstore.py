@@ -0,0 +1,513 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import json
+import re
+import threading
+import numpy as np
+from pinecone.exceptions import PineconeProtocolError
+from urllib3.exceptions import HTTPError as TransportError
+from nya_basic_chat.clients import get_pinecone_index
+from nya_basic_chat.config import VECTOR_STORE_DIR, get_secret
+from nya_basic_chat.rag.retry import with_retries
+
+# Pinecone caps an upsert request at 2 MB and 1,000 vectors; keep headroom on the size
+PINECONE_UPSERT_MAX_BYTES = 1_800_000
+PINECONE_UPSERT_MAX_VECTORS = 1000
+# Upsert requests in flight at once
+PINECONE_UPSERT_WORKERS = 4
+# Ids per delete request
+PINECONE_DELETE_BATCH = 1000
+# Upper bound on the JSON size of one float value, sign, exponent and separator included
+_FLOAT_JSON_BYTES = 24
+
+# Rows added to a local namespace file at a time when it runs out of space
+LOCAL_GROW_ROWS = 1024
+# Deleted rows tolerated before a local namespace is rewritten without them
+LOCAL_COMPACT_MIN_DEAD = 1024
+
+
+@dataclass
+class Match:
+    id: str
+    score: float
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class Vector:
+    id: str
+    values: list
+    metadata: dict = field(default_factory=dict)
+
+
+class VectorStore(ABC):
+    """
+    Interface shared by the vector index backends.
+
+    Vectors are dicts `{id, values, metadata}` as Pinecone takes them. `query`
+    returns matches best first, each with `id`, `score` and `metadata`, and
+    `fetch` returns `{id: vector}` for the ids that exist. Filters use Pinecone's
+    metadata filter syntax.
+    """
+
+    @abstractmethod
+    def upsert(self, vectors, namespace): ...
+
+    @abstractmethod
+    def query(self, vector, namespace, filter=None, top_k=10): ...
+
+    @abstractmethod
+    def fetch(self, ids, namespace): ...
+
+    @abstractmethod
+    def delete(self, ids, namespace): ...
+
+
+def vector_payload_bytes(vector):
+    """Upper bound on the serialized size of one vector in an upsert request."""
+    metadata = json.dumps(vector.get("metadata") or {}, ensure_ascii=False)
+    return (
+        len(vector["id"]) + len(vector["values"]) * _FLOAT_JSON_BYTES + len(metadata.encode()) + 64
+    )
+
+
+def pack_vectors(
+    vectors, max_bytes=PINECONE_UPSERT_MAX_BYTES, max_vectors=PINECONE_UPSERT_MAX_VECTORS
+):
+    """Split `vectors` into request-sized lists by payload bytes and vector count."""
+    batches = []
+    batch, batch_bytes = [], 0
+    for v in vectors:
+        n = vector_payload_bytes(v)
+        if batch and (batch_bytes + n > max_bytes or len(batch) >= max_vectors):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(v)
+        batch_bytes += n
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_transient(error):
+    """
+    Whether a Pinecone call failing with `error` is worth retrying.
+
+    Timeouts, connection errors, 429 and 5xx responses are; other API errors such as
+    a wrong dimension, oversized metadata or a bad key fail the same way every time.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, (TimeoutError, ConnectionError, TransportError, PineconeProtocolError))
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    Pinecone index behind the VectorStore interface.
+
+    Upserts are packed into requests by payload size rather than a fixed count,
+    since metadata carries variable-length section lists, and up to `workers`
+    requests run at once. Each request is retried on its own, on transient errors only.
+    """
+
+    def __init__(self, index, workers=PINECONE_UPSERT_WORKERS, attempts=3):
+        self.index = index
+        self.workers = workers
+        self.attempts = attempts
+
+    def upsert(self, vectors, namespace):
+        def send(batch):
+            with_retries(
+                lambda: self.index.upsert(vectors=batch, namespace=namespace),
+                attempts=self.attempts,
+                backoff=1.0,
+                retry_if=is_transient,
+            )
+
+        batches = pack_vectors(list(vectors))
+        if len(batches) <= 1:
+            if batches:
+                send(batches[0])
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as pool:
+            # list() surfaces the first batch that failed all its attempts
+            list(pool.map(send, batches))
+
+    def query(self, vector, namespace, filter=None, top_k=10):
+        return self.index.query(
+            vector=vector,
+            namespace=namespace,
+            filter=filter,
+            top_k=top_k,
+            include_metadata=True,
+        ).matches
+
+    def fetch(self, ids, namespace):
+        return self.index.fetch(ids=list(ids), namespace=namespace).vectors
+
+    def delete(self, ids, namespace):
+        ids = list(ids)
+        for i in range(0, len(ids), PINECONE_DELETE_BATCH):
+            self.index.delete(ids=ids[i : i + PINECONE_DELETE_BATCH], namespace=namespace)
+
+
+# ---------- Local backend ----------
+
+
+def _match_value(value, cond):
+    """Evaluate one Pinecone filter condition against a metadata value (lists match any)."""
+    if not isinstance(cond, dict):
+        cond = {"$eq": cond}
+    values = value if isinstance(value, list) else [value]
+    for op, arg in cond.items():
+        if op == "$eq":
+            ok = arg in values
+        elif op == "$ne":
+            ok = arg not in values
+        elif op == "$in":
+            ok = any(v in arg for v in values)
+        elif op == "$nin":
+            ok = not any(v in arg for v in values)
+        elif op == "$exists":
+            ok = (value is not None) == arg
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return False
+            ok = {
+                "$gt": value > arg,
+                "$gte": value >= arg,
+                "$lt": value < arg,
+                "$lte": value <= arg,
+            }[op]
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches_filter(metadata, flt):
+    """Evaluate a Pinecone metadata filter against one vector's metadata."""
+    for key, cond in (flt or {}).items():
+        if key == "$and":
+            ok = all(matches_filter(metadata, sub) for sub in cond)
+        elif key == "$or":
+            ok = any(matches_filter(metadata, sub) for sub in cond)
+        else:
+            ok = _match_value((metadata or {}).get(key), cond)
+        if not ok:
+            return False
+    return True
+
+
+class _Namespace:
+    """
+    One namespace of the local store.
+
+    Unit-normalised vectors live in a memory-mapped `vectors.bin`, one row each.
+    Ids and metadata live in memory and are persisted as an append-only
+    `rows.jsonl` log of upserts and deletes that is replayed on open. Deleted rows
+    are only masked out until enough accumulate to rewrite both files.
+    """
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.vectors = None
+        self.ids = []
+        self.metadata = []
+        self.live = np.zeros(0, dtype=bool)
+        self.rows = {}
+        self._columns = {}
+        self._load()
+
+    # ----- persistence -----
+
+    def _load(self):
+        info_file = self.path / "info.json"
+        if not info_file.exists():
+            return
+        info = json.loads(info_file.read_text())
+        self.dim = info["dim"]
+        self.dtype = np.dtype(info["dtype"])
+
+        live = []
+        with open(self.path / "rows.jsonl", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                if "delete" in rec:
+                    row = self.rows.pop(rec["delete"], None)
+                    if row is not None:
+                        live[row] = False
+                    continue
+                row = rec["row"]
+                if row == len(self.ids):
+                    self.ids.append(rec["id"])
+                    self.metadata.append(rec["metadata"])
+                    live.append(True)
+                else:
+                    self.metadata[row] = rec["metadata"]
+                    live[row] = True
+                self.rows[rec["id"]] = row
+        self.live = np.array(live, dtype=bool)
+        self._open_vectors()
+
+    def _open_vectors(self, min_rows=0):
+        if self.vectors is not None and len(self.vectors) >= min_rows:
+            return
+        file = self.path / "vectors.bin"
+        row_bytes = self.dim * self.dtype.itemsize
+        size = file.stat().st_size if file.exists() else 0
+        if size < min_rows * row_bytes:
+            if self.vectors is not None:
+                self.vectors.flush()
+            rows = max(min_rows, size // row_bytes + LOCAL_GROW_ROWS)
+            with open(file, "ab") as f:
+                f.truncate(rows * row_bytes)
+            size = rows * row_bytes
+        self.vectors = (
+            np.memmap(file, dtype=self.dtype, mode="r+", shape=(size // row_bytes, self.dim))
+            if size
+            else None
+        )
+
+    def _init(self, dim):
+        self.dim = dim
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / "info.json").write_text(json.dumps({"dim": dim, "dtype": self.dtype.name}))
+        (self.path / "rows.jsonl").touch()
+
+    def _append_log(self, records):
+        with open(self.path / "rows.jsonl", "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+
+    # ----- writes -----
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        if self.dim is None:
+            self._init(len(vectors[0]["values"]))
+
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        if values.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {values.shape[1]} does not match {self.dim}")
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values /= np.where(norms == 0, 1, norms)
+
+        rows = []
+        for v in vectors:
+            row = self.rows.get(v["id"])
+            if row is None:
+                row = len(self.ids)
+                self.ids.append(v["id"])
+                self.metadata.append(None)
+                self.rows[v["id"]] = row
+            self.metadata[row] = dict(v.get("metadata") or {})
+            rows.append(row)
+
+        if len(self.live) < len(self.ids):
+            self.live = np.concatenate(
+                [self.live, np.zeros(len(self.ids) - len(self.live), dtype=bool)]
+            )
+        self.live[rows] = True
+
+        self._open_vectors(min_rows=len(self.ids))
+        self.vectors[rows] = values
+        self.vectors.flush()
+        # The log is written after the vectors so it never points at unwritten rows
+        self._append_log(
+            {"row": r, "id": v["id"], "metadata": self.metadata[r]} for r, v in zip(rows, vectors)
+        )
+        self._columns.clear()
+
+    def delete(self, ids):
+        removed = []
+        for i in ids:
+            row = self.rows.pop(i, None)
+            if row is not None:
+                self.live[row] = False
+                removed.append(i)
+        if not removed:
+            return
+        self._append_log({"delete": i} for i in removed)
+        self._columns.clear()
+
+        dead = len(self.ids) - len(self.rows)
+        if dead >= LOCAL_COMPACT_MIN_DEAD and dead > len(self.rows):
+            self._compact()
+
+    def _compact(self):
+        keep = np.flatnonzero(self.live[: len(self.ids)])
+        kept = np.array(self.vectors[keep])
+        ids = [self.ids[r] for r in keep]
+        metadata = [self.metadata[r] for r in keep]
+
+        tmp = self.path / "vectors.bin.tmp"
+        kept.tofile(tmp)
+        log_tmp = self.path / "rows.jsonl.tmp"
+        log_tmp.write_text(
+            "".join(
+                json.dumps({"row": r, "id": i, "metadata": m}) + "\n"
+                for r, (i, m) in enumerate(zip(ids, metadata))
+            ),
+            encoding="utf-8",
+        )
+        self.vectors._mmap.close()
+        self.vectors = None
+        tmp.replace(self.path / "vectors.bin")
+        log_tmp.replace(self.path / "rows.jsonl")
+
+        self.ids, self.metadata = ids, metadata
+        self.rows = {i: r for r, i in enumerate(ids)}
+        self.live = np.ones(len(ids), dtype=bool)
+        self._open_vectors()
+
+    # ----- reads -----
+
+    def _column(self, key):
+        """
+        Dictionary-encode one metadata key over all rows, so equality and set filters
+        become integer comparisons. Returns None for keys holding lists.
+        """
+        if key not in self._columns:
+            values = [(m or {}).get(key) for m in self.metadata]
+            if any(isinstance(v, list) for v in values):
+                self._columns[key] = None
+            else:
+                vocab = {}
+                codes = np.fromiter(
+                    (vocab.setdefault(v, len(vocab)) for v in values), np.int32, len(values)
+                )
+                self._columns[key] = (vocab, codes)
+        return self._columns[key]
+
+    def _mask(self, flt):
+        n = len(self.ids)
+        mask = np.ones(n, dtype=bool)
+        for key, cond in (flt or {}).items():
+            if key == "$and":
+                for sub in cond:
+                    mask &= self._mask(sub)
+                continue
+            if key == "$or":
+                any_mask = np.zeros(n, dtype=bool)
+                for sub in cond:
+                    any_mask |= self._mask(sub)
+                mask &= any_mask
+                continue
+            if not isinstance(cond, dict):
+                cond = {"$eq": cond}
+
+            column = self._column(key)
+            for op, arg in cond.items():
+                if column is not None and op in ("$eq", "$ne", "$in", "$nin"):
+                    vocab, codes = column
+                    wanted = [arg] if op in ("$eq", "$ne") else arg
+                    hit = np.isin(codes, [vocab[v] for v in wanted if v in vocab])
+                    mask &= ~hit if op in ("$ne", "$nin") else hit
+                else:
+                    mask &= np.fromiter(
+                        (_match_value((m or {}).get(key), {op: arg}) for m in self.metadata),
+                        bool,
+                        n,
+                    )
+        return mask
+
+    def query(self, vector, flt, top_k):
+        if self.dim is None or not self.rows:
+            return []
+        q = np.asarray(vector, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1
+
+        mask = self.live[: len(self.ids)]
+        if flt:
+            mask = mask & self._mask(flt)
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+
+        if len(candidates) == len(self.ids):
+            scores = self.vectors[: len(self.ids)] @ q
+        else:
+            scores = self.vectors[candidates] @ q
+        k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            Match(self.ids[r], float(scores[b]), dict(self.metadata[r]))
+            for b, r in ((b, candidates[b]) for b in best)
+        ]
+
+    def fetch(self, ids):
+        out = {}
+        for i in ids:
+            row = self.rows.get(i)
+            if row is not None:
+                out[i] = Vector(
+                    i, self.vectors[row].astype(np.float32).tolist(), self.metadata[row]
+                )
+        return out
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Vector index on local disk for offline sites, tests and benchmarks.
+
+    Each namespace is a memory-mapped matrix of unit-normalised float32 or float16
+    vectors searched by brute-force cosine similarity, with metadata filters
+    evaluated as numpy masks. Scores match Pinecone's cosine metric. Meant for a
+    single process; writes are serialised by a lock per store.
+    """
+
+    def __init__(self, root=VECTOR_STORE_DIR, dtype="float32"):
+        self.root = root
+        self.dtype = dtype
+        self.lock = threading.Lock()
+        self.namespaces = {}
+
+    def _ns(self, namespace):
+        ns = self.namespaces.get(namespace)
+        if ns is None:
+            safe = re.sub(r"[^A-Za-z0-9_.-]", "_", namespace or "default")
+            ns = self.namespaces[namespace] = _Namespace(self.root / safe, self.dtype)
+        return ns
+
+    def upsert(self, vectors, namespace):
+        with self.lock:
+            self._ns(namespace).upsert(list(vectors))
+
+    def query(self, vector, namespace, filter=None, top_k=10):
+        with self.lock:
+            return self._ns(namespace).query(vector, filter, top_k)
+
+    def fetch(self, ids, namespace):
+        with self.lock:
+            return self._ns(namespace).fetch(ids)
+
+    def delete(self, ids, namespace):
+        with self.lock:
+            self._ns(namespace).delete(ids)
+
+
+_local_store = None
+_local_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    """Return the vector store selected by VECTOR_STORE ("pinecone" or "local")."""
+    global _local_store
+    if get_secret("VECTOR_STORE", "pinecone") == "local":
+        # One instance per process, so every caller sees the same in-memory rows
+        with _local_store_lock:
+            if _local_store is None:
+                _local_store = LocalVectorStore(
+                    dtype=get_secret("VECTOR_STORE_DTYPE", "float32"),
+                )
+            return _local_store
+    return PineconeVectorStore(get_pinecone_index())
@@ -0,0 +1,73 @@
+import json
+from nya_basic_chat.rag.retry import with_retries
+
+# Rows per multi-row upsert
+CHUNK_UPSERT_BATCH_SIZE = 200
+# Cap on the serialized JSON body of one upsert request
+CHUNK_UPSERT_MAX_BYTES = 1_000_000
+
+
+class ChunkRowWriter:
+    """
+    Buffer rows for a Supabase table and write them as multi-row upserts.
+
+    A batch is sent when it reaches `batch_size` rows or when the next row would
+    push its JSON payload past `max_bytes`. Each batch is retried on its own.
+    Call `flush()` (or use the writer as a context manager) to send the remainder.
+    """
+
+    def __init__(
+        self,
+        sb,
+        table="chunks",
+        batch_size=CHUNK_UPSERT_BATCH_SIZE,
+        max_bytes=CHUNK_UPSERT_MAX_BYTES,
+        attempts=3,
+    ):
+        self.sb = sb
+        self.table = table
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.attempts = attempts
+        self.rows = []
+        self.size = 0
+        self.requests = 0
+
+    def add(self, row):
+        row_bytes = len(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+        if self.rows and (
+            len(self.rows) >= self.batch_size or self.size + row_bytes > self.max_bytes
+        ):
+            self.flush()
+        self.rows.append(row)
+        self.size += row_bytes
+
+    def flush(self):
+        if not self.rows:
+            return
+        rows = self.rows
+        self.rows = []
+        self.size = 0
+        with_retries(
+            lambda: self.sb.table(self.table).upsert(rows).execute(), attempts=self.attempts
+        )
+        self.requests += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+
+def select_all(query, page_size=1000):
+    """Page through a Supabase select; PostgREST caps a single response at 1,000 rows."""
+    out = []
+    start = 0
+    while True:
+        rows = query.range(start, start + page_size - 1).execute().data
+        out.extend(rows)
+        if len(rows) < page_size:
+            return out
+        start += page_size
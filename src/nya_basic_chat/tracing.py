@@ -0,0 +1,300 @@
+# Location: src/nya_basic_chat/tracing.py
+import atexit
+import contextvars
+import functools
+import json
+import math
+import queue
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import httpx
+from nya_basic_chat.config import TRACE_FILE, get_secret
+
+# TRACE_EXPORT selects where finished spans go: "jsonl", "otlp", or unset for no tracing
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4318/v1/traces"
+SERVICE_NAME = "nya-basic-chat"
+# Finished spans waiting for export; further spans are dropped while it is full
+MAX_PENDING_SPANS = 10_000
+# Spans per export write, and seconds between writes
+EXPORT_BATCH = 512
+EXPORT_INTERVAL = 2.0
+
+_current = contextvars.ContextVar("nya_span", default=None)
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+class Span:
+    """One timed operation; spans opened while it is current become its children."""
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._t0 = time.perf_counter_ns()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._t0
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoSpan:
+    """Stands in for a span when tracing is off."""
+
+    def set(self, **attributes):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a span named `name`, nested under the current span.
+
+    Yields the span so attributes known only later can be added with `set`.
+    Exceptions are recorded on the span and re-raised.
+    """
+    exporter = _get_exporter()
+    if exporter is None:
+        yield _NO_SPAN
+        return
+
+    s = Span(name, _current.get(), attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.finish()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # A generator holding the span was closed from another context
+            pass
+        exporter.submit(s)
+
+
+def traced(name):
+    """Decorator running each call of the function in a span named `name`."""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def bind(fn):
+    """
+    Return `fn` bound to a copy of the current context.
+
+    Work submitted to a thread pool does not inherit the submitter's context;
+    binding it keeps spans opened there under the submitting span.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+# ---------- export ----------
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s):
+    out = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+class _Exporter:
+    """Writes finished spans from a background thread, so spans never wait on I/O."""
+
+    def __init__(self, write):
+        self.write = write
+        self.pending = queue.Queue(maxsize=MAX_PENDING_SPANS)
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, name="trace-export", daemon=True).start()
+        atexit.register(self.flush)
+
+    def submit(self, s):
+        try:
+            self.pending.put_nowait(s)
+        except queue.Full:
+            # The exporter is falling behind; losing spans beats slowing requests
+            pass
+
+    def _run(self):
+        while True:
+            time.sleep(EXPORT_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Write every pending span; runs every EXPORT_INTERVAL and at interpreter exit."""
+        with self.lock:
+            while True:
+                batch = []
+                while len(batch) < EXPORT_BATCH:
+                    try:
+                        batch.append(self.pending.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    print("Error exporting spans:", e)
+
+
+def _write_jsonl(path):
+    def write(batch):
+        with open(path, "a", encoding="utf-8") as f:
+            for s in batch:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+    return write
+
+
+def _write_otlp(endpoint):
+    client = httpx.Client(timeout=5)
+
+    def write(batch):
+        client.post(
+            endpoint,
+            json={
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": "nya_basic_chat"},
+                                "spans": [_otlp_span(s) for s in batch],
+                            }
+                        ],
+                    }
+                ]
+            },
+        ).raise_for_status()
+
+    return write
+
+
+def _get_exporter():
+    """The process-wide exporter chosen by TRACE_EXPORT, or None when tracing is off."""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                kind = (get_secret("TRACE_EXPORT") or "").strip().lower()
+                if kind == "jsonl":
+                    _exporter = _Exporter(_write_jsonl(get_secret("TRACE_FILE", TRACE_FILE)))
+                elif kind == "otlp":
+                    endpoint = get_secret("TRACE_OTLP_ENDPOINT", DEFAULT_OTLP_ENDPOINT)
+                    _exporter = _Exporter(_write_otlp(endpoint))
+                else:
+                    _exporter = False
+    return _exporter or None
+
+
+# ---------- summary ----------
+
+
+def _percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(path=TRACE_FILE):
+    """Per span name: count, errors, p50_ms, p99_ms and mean_ms, from a JSON-lines trace file."""
+    durations, errors = {}, {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            s = json.loads(line)
+            durations.setdefault(s["name"], []).append(s["duration_ms"])
+            errors[s["name"]] = errors.get(s["name"], 0) + bool(s.get("error"))
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "p50_ms": _percentile(values, 50),
+            "p99_ms": _percentile(values, 99),
+            "mean_ms": sum(values) / len(values),
+        }
+    return summary
+
+
+def print_summary(path=TRACE_FILE):
+    summary = summarize(path)
+    width = max([len(name) for name in summary] + [4])
+    header = ("count", "errors", "p50 ms", "p99 ms", "mean ms")
+    print(f"{'span':<{width}} {header[0]:>7} {header[1]:>6}", *(f"{h:>10}" for h in header[2:]))
+    for name, s in sorted(summary.items(), key=lambda item: -item[1]["p99_ms"]):
+        print(
+            f"{name:<{width}} {s['count']:>7} {s['errors']:>6} "
+            f"{s['p50_ms']:>10.1f} {s['p99_ms']:>10.1f} {s['mean_ms']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    # Per-stage latency from a JSON-lines trace file
+    print_summary(sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE)
@@ -0,0 +1,4 @@
+-- Original uploads are stored by SHA-256; record the hash so duplicates can be linked
+alter table attachments add column if not exists content_sha256 text;
+
+create index if not exists attachments_content_sha256_idx on attachments (content_sha256);
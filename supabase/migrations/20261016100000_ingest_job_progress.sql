@@ -0,0 +1,8 @@
+-- attachment_processing_status doubles as the ingestion job queue
+alter table attachment_processing_status
+    add column if not exists total_pages integer,
+    add column if not exists pages_done integer,
+    add column if not exists chunks_done integer;
+
+create index if not exists attachment_processing_status_status_idx
+    on attachment_processing_status (status);
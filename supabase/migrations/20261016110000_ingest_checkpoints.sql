@@ -0,0 +1,8 @@
+-- Per-batch ingestion checkpoints, so a failed ingestion can resume instead of restarting
+alter table attachment_processing_status
+    add column if not exists last_extracted_page integer,
+    add column if not exists last_embedded_batch integer,
+    add column if not exists last_upserted_batch integer,
+    add column if not exists resume_chunk_index integer,
+    add column if not exists resume_page integer,
+    add column if not exists resume_token_offset integer;
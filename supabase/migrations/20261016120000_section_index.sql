@@ -0,0 +1,16 @@
+-- Inverted index from building-code section number to the chunks that introduce or cite it.
+-- Rows go away with their chunk, so cleanup and reindexing keep it consistent.
+create table if not exists section_index (
+    section text not null,
+    chunk_id text not null references chunks (id) on delete cascade,
+    attachment_id text not null,
+    namespace text not null,
+    category text not null,
+    file_name text,
+    is_main boolean not null default false,
+    primary key (section, chunk_id)
+);
+
+create index if not exists section_index_namespace_section_idx
+    on section_index (namespace, section);
+create index if not exists section_index_chunk_id_idx on section_index (chunk_id);
@@ -0,0 +1,10 @@
+-- Expired temporary uploads are found by age across all users, oldest first.
+create index if not exists attachments_temp_created_at_idx
+    on attachments (created_at) where is_temp;
+
+-- Named leases elect the one process that runs a background task such as the temp-file sweeper.
+create table if not exists worker_leases (
+    name text primary key,
+    holder text not null,
+    expires_at timestamptz not null
+);
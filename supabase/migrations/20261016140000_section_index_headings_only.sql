@@ -0,0 +1,3 @@
+-- section_index now only holds the chunks that introduce a section; citation rows were never read.
+delete from section_index where not is_main;
+alter table section_index alter column is_main set default true;
@@ -0,0 +1,6 @@
+-- One token per vector namespace, rewritten by any process that changes the namespace.
+-- Processes compare it against the token their cached query results were keyed on.
+create table if not exists namespace_versions (
+    namespace text primary key,
+    version text not null
+);
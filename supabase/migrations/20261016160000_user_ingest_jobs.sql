@@ -0,0 +1,12 @@
+-- Failed jobs stay in the sidebar until the user retries or dismisses them
+alter table attachment_processing_status
+    add column if not exists dismissed boolean not null default false;
+
+create index if not exists attachments_user_id_idx on attachments (user_id);
+
+-- Status rows joined to their attachment's owner, so a user's jobs are filtered by status
+-- and user in one query instead of by the user's full list of attachment ids
+create or replace view user_ingest_jobs with (security_invoker = true) as
+select s.*, a.user_id, a.file_name
+from attachment_processing_status s
+join attachments a on a.id = s.attachment_id;
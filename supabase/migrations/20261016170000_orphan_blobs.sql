@@ -0,0 +1,6 @@
+-- Blobs whose last attachment was deleted while they were within the delete grace period.
+-- The sweeper deletes them once the grace period is over, unless they are referenced again.
+create table if not exists orphan_blobs (
+    content_sha256 text primary key,
+    recorded_at timestamptz not null default now()
+);
@@ -0,0 +1,53 @@
+import pytest
+from nya_basic_chat.rag import processor
+
+
+class CharEncoding:
+    """One token per character, so offsets are easy to reason about."""
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def char_encoding(monkeypatch):
+    monkeypatch.setattr(processor, "get_encoding", lambda *args: CharEncoding())
+
+
+def _pages(texts):
+    return [{"page": i + 1, "text": t} for i, t in enumerate(texts)]
+
+
+def _chunk(pages, **kwargs):
+    return list(processor._chunk_pages(iter(pages), chunk_size=50, overlap=10, **kwargs))
+
+
+@pytest.mark.parametrize(
+    "texts",
+    [
+        ["a" * 70, "b" * 45, "c" * 120, "d" * 5, "e" * 80],
+        # An image-only cover page extracts as empty text
+        ["", "x" * 60, "y" * 90, "", "z" * 75],
+    ],
+)
+def test_resume_matches_uninterrupted_run(texts):
+    pages = _pages(texts)
+    full = _chunk(pages)
+    assert len(full) > 3
+
+    # A checkpoint records the last stored chunk's page and that page's token offset
+    for last in full[:-1]:
+        resumed = _chunk(
+            pages[last["page"] - 1 :],
+            start_index=last["index"] + 1,
+            start_offset=last["page_offset"],
+        )
+        assert resumed == full[last["index"] + 1 :]
+
+
+def test_pages_are_joined_with_newlines():
+    chunks = _chunk(_pages(["", "ab", "cd"]))
+    assert [c["chunk"] for c in chunks] == ["\nab\ncd"]
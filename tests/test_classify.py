@@ -0,0 +1,50 @@
+from nya_basic_chat.rag.classify import classify_heuristic
+
+CODE_SAMPLE = """CHAPTER 16 STRUCTURAL DESIGN
+SECTION 1613 EARTHQUAKE LOADS
+1613.1 Scope. Every structure shall be designed for earthquake loads.
+1613.2 Seismic ground motion values.
+1613.2.1 Mapped acceleration parameters.
+1613.2.2 Site class definitions.
+"""
+
+REPORT_SAMPLE = """GEOTECHNICAL INVESTIGATION REPORT
+SECTION 1 INTRODUCTION
+1.1 Purpose
+1.1.1 Scope of work
+This report presents the results of our field exploration.
+1.1.2 Site description
+1.2 Proposed construction
+The project consists of a three-story office building.
+"""
+
+TEXTBOOK_SAMPLE = """CHAPTER 3 BEAM DESIGN
+3.1 Introduction
+3.1.1 Flexure
+3.1.2 Shear
+3.2 Deflection
+3.2.1 Serviceability limits
+Beams must satisfy strength and serviceability requirements.
+"""
+
+DRAWING_SAMPLE = """STRUCTURAL FOUNDATION PLAN
+Drawn by: JS   Checked by: AB
+Scale: 1/8" = 1'-0"
+Sheet 3 of 12
+"""
+
+
+def test_code_sample_is_a_building_code():
+    assert classify_heuristic(CODE_SAMPLE) == ("building_code", True)
+
+
+def test_report_with_uppercase_section_heading_is_left_to_the_llm():
+    assert classify_heuristic(REPORT_SAMPLE) is None
+
+
+def test_textbook_with_uppercase_chapter_heading_is_left_to_the_llm():
+    assert classify_heuristic(TEXTBOOK_SAMPLE) is None
+
+
+def test_drawing_title_block():
+    assert classify_heuristic(DRAWING_SAMPLE) == ("drawing", False)
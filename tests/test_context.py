@@ -0,0 +1,81 @@
+import pytest
+from nya_basic_chat.rag import context
+from nya_basic_chat.rag.context import assemble_context, format_context
+from nya_basic_chat.rag.vectorstore import Match
+
+
+class CharEncoding:
+    """One token per character, so budgets are easy to reason about."""
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+
+@pytest.fixture(autouse=True)
+def char_encoding(monkeypatch):
+    monkeypatch.setattr(context, "get_encoding", lambda *args: CharEncoding())
+
+
+TEXT = " ".join(f"word{i}" for i in range(60))
+
+
+def _row(id, content, attachment="a1", index=0, page=1):
+    return {
+        "id": id,
+        "content": content,
+        "attachment_id": attachment,
+        "chunk_index": index,
+        "page_number": page,
+    }
+
+
+def _assemble(scored_rows, **kwargs):
+    matches = [Match(r["id"], score, {"file_name": "f.pdf"}) for r, score in scored_rows]
+    return assemble_context(matches, {r["id"]: r for r, _ in scored_rows}, **kwargs)
+
+
+def test_adjacent_chunks_are_joined_at_their_overlap():
+    first = _row("c0", TEXT[:250], index=0, page=1)
+    second = _row("c1", TEXT[150:], index=1, page=2)
+    (excerpt,) = _assemble([(second, 0.9), (first, 0.8)])
+    assert excerpt.content == TEXT
+    assert excerpt.chunk_ids == {"c0", "c1"}
+    assert excerpt.pages() == "Pages 1-2"
+
+
+def test_near_duplicates_are_dropped():
+    words = TEXT.split()
+    copy = _row("b", " ".join(words[:-1] + ["other"]), attachment="a2")
+    excerpts = _assemble([(_row("a", TEXT), 0.9), (copy, 0.85)])
+    assert [e.chunk_ids for e in excerpts] == [{"a"}]
+
+
+def test_budget_counts_the_source_headers():
+    texts = [" ".join(f"w{i}x{j:02}" for j in range(60)) for i in range(3)]
+    rows = [
+        (_row(f"r{i}", text, attachment=f"a{i}", index=i), 0.9 - i / 100)
+        for i, text in enumerate(texts)
+    ]
+    one = format_context(_assemble(rows[:1]))
+    # Room for two excerpts' content, but not with their headers
+    max_tokens = 2 * len(texts[0]) + 10
+    excerpts = _assemble(rows, max_tokens=max_tokens)
+    assert len(excerpts) == 1
+    assert len(format_context(excerpts)) == len(one) <= max_tokens
+
+    excerpts = _assemble(rows, max_tokens=2 * len(one) + 2)
+    assert len(excerpts) == 2
+    assert len(format_context(excerpts)) <= 2 * len(one) + 2
+
+
+def test_selected_files_are_exempt_from_the_relative_cutoff():
+    library = _row("lib", TEXT, attachment="perm")
+    temp = _row("tmp", "selected file text " * 5, attachment="temp")
+    scored = [(library, 0.9), (temp, 0.4)]
+
+    assert [e.attachment_id for e in _assemble(scored)] == ["perm"]
+    assert [e.attachment_id for e in _assemble(scored, file_ids=["temp"])] == ["perm", "temp"]
+    # min_score still applies
+    assert [e.attachment_id for e in _assemble(scored, file_ids=["temp"], min_score=0.5)] == [
+        "perm"
+    ]
@@ -0,0 +1,40 @@
+import threading
+import time
+from nya_basic_chat.rag import extract
+
+
+def test_in_process_engine_calls_never_overlap(monkeypatch):
+    active, overlaps = [0], []
+    guard = threading.Lock()
+
+    def enter():
+        with guard:
+            active[0] += 1
+            overlaps.append(active[0] > 1)
+        time.sleep(0.01)
+        with guard:
+            active[0] -= 1
+
+    def page_count(path):
+        enter()
+        return 3
+
+    def extract_range(path, start, stop):
+        enter()
+        return [{"page": i + 1, "text": f"p{i + 1}"} for i in range(start, stop)]
+
+    monkeypatch.setitem(extract.ENGINES, "fake", (page_count, extract_range))
+
+    results = []
+
+    def run():
+        results.append([p["page"] for p in extract.iter_pages(b"%PDF", engine="fake")])
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [[1, 2, 3]] * 4
+    assert not any(overlaps)
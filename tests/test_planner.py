@@ -0,0 +1,61 @@
+from nya_basic_chat.rag.planner import QuerySpec, plan_queries, run_queries
+from nya_basic_chat.rag.vectorstore import LocalVectorStore
+
+PERM = QuerySpec("u1", {"category": "personal_perm"}, 3)
+TEMP = QuerySpec("u1", {"attachment_id": {"$in": ["t1"]}, "category": "personal_temp"}, 3)
+
+
+def _store(tmp_path, perm, temp):
+    store = LocalVectorStore(root=tmp_path)
+    # Permanent chunks point along the query; the selected temp file's chunks less so
+    vectors = [
+        {"id": f"p{i}", "values": [1.0, 0.01 * i], "metadata": {"category": "personal_perm"}}
+        for i in range(perm)
+    ] + [
+        {
+            "id": f"t{i}",
+            "values": [1.0, 1.0 + i],
+            "metadata": {"category": "personal_temp", "attachment_id": "t1"},
+        }
+        for i in range(temp)
+    ]
+    store.upsert(vectors, "u1")
+    return store
+
+
+def test_same_namespace_queries_are_merged():
+    (merged,) = plan_queries([PERM, TEMP])
+    assert merged.filter == {"$or": [PERM.filter, TEMP.filter]}
+    assert merged.top_k == 6
+    assert merged.branches == (PERM, TEMP)
+
+
+def test_crowded_out_branch_is_topped_up(tmp_path):
+    store = _store(tmp_path, perm=20, temp=5)
+    calls = []
+
+    def query(*args, **kwargs):
+        calls.append(kwargs["filter"])
+        return store.query(*args, **kwargs)
+
+    matches, fetched = run_queries(
+        query, [1.0, 0.0], plan_queries([PERM, TEMP]), fetch=lambda ids: {i: i for i in ids}
+    )
+    ids = [m.id for m in matches]
+    assert sum(i.startswith("t") for i in ids) == 3
+    assert sum(i.startswith("p") for i in ids) >= 3
+    assert calls[1] == TEMP.filter
+    assert set(fetched) == set(ids)
+
+
+def test_short_merged_result_needs_no_top_up(tmp_path):
+    store = _store(tmp_path, perm=2, temp=1)
+    calls = []
+
+    def query(*args, **kwargs):
+        calls.append(kwargs["filter"])
+        return store.query(*args, **kwargs)
+
+    matches, _ = run_queries(query, [1.0, 0.0], plan_queries([PERM, TEMP]))
+    assert len(matches) == 3
+    assert len(calls) == 1
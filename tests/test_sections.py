@@ -0,0 +1,49 @@
+import pytest
+from nya_basic_chat.rag import sections
+from nya_basic_chat.rag.cache import JsonCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = JsonCache("sections", path=tmp_path / "cache.db")
+    monkeypatch.setattr(sections, "_get_fallback_cache", lambda: cache)
+    monkeypatch.setattr(sections, "get_openai", lambda: None)
+    return cache
+
+
+def _fake_llm(monkeypatch, skip):
+    """Answer every chunk with its own text as the section, except those in `skip`."""
+    calls = []
+
+    def extract(client, chunks):
+        calls.append(list(chunks))
+        return {i: ([c], []) for i, c in enumerate(chunks) if c not in skip}
+
+    monkeypatch.setattr(sections, "_extract_sections_llm", extract)
+    return calls
+
+
+def test_chunk_left_out_of_a_batch_is_asked_alone(cache, monkeypatch):
+    skipped_once = {"b"}
+
+    def extract(client, chunks):
+        if len(chunks) > 1:
+            return {i: ([c], []) for i, c in enumerate(chunks) if c not in skipped_once}
+        return {0: ([chunks[0]], [])}
+
+    monkeypatch.setattr(sections, "_extract_sections_llm", extract)
+    assert sections.fallback_extract_sections(["a", "b", "c"]) == [
+        (["a"], []),
+        (["b"], []),
+        (["c"], []),
+    ]
+
+
+def test_unanswered_chunk_is_not_cached(cache, monkeypatch):
+    _fake_llm(monkeypatch, skip={"b"})
+    assert sections.fallback_extract_sections(["a", "b"]) == [(["a"], []), ([], [])]
+
+    calls = _fake_llm(monkeypatch, skip=set())
+    assert sections.fallback_extract_sections(["a", "b"]) == [(["a"], []), (["b"], [])]
+    # "a" came from the cache; only "b" went back to the model
+    assert calls == [["b"]]
@@ -0,0 +1,126 @@
+import pytest
+from nya_basic_chat.rag import retry, vectorstore
+from nya_basic_chat.rag.vectorstore import LocalVectorStore, PineconeVectorStore, VectorStore
+
+
+class ApiError(Exception):
+    """Stands in for PineconeApiException, which carries the HTTP status."""
+
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class FlakyIndex:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def upsert(self, vectors, namespace):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(retry.time, "sleep", lambda s: None)
+
+
+VECTORS = [{"id": "a", "values": [0.1, 0.2], "metadata": {}}]
+
+
+@pytest.mark.parametrize("error", [ApiError(429), ApiError(503), TimeoutError("read timed out")])
+def test_upsert_retries_transient_errors(error):
+    index = FlakyIndex([error])
+    PineconeVectorStore(index).upsert(VECTORS, "ns")
+    assert index.calls == 2
+
+
+@pytest.mark.parametrize("status", [400, 401, 413])
+def test_upsert_fails_fast_on_client_errors(status):
+    index = FlakyIndex([ApiError(status)])
+    with pytest.raises(ApiError):
+        PineconeVectorStore(index).upsert(VECTORS, "ns")
+    assert index.calls == 1
+
+
+def _vec(id, values, **metadata):
+    return {"id": id, "values": values, "metadata": metadata}
+
+
+@pytest.fixture
+def local(tmp_path):
+    store = LocalVectorStore(root=tmp_path)
+    store.upsert(
+        [
+            _vec("x", [1.0, 0.0], category="personal_perm", attachment_id="a1"),
+            _vec("xy", [1.0, 1.0], category="personal_temp", attachment_id="a2"),
+            _vec("y", [0.0, 2.0], category="global_perm", attachment_id="a3"),
+        ],
+        "ns",
+    )
+    return store
+
+
+def test_incomplete_backend_fails_on_construction():
+    class QueryOnly(VectorStore):
+        def query(self, vector, namespace, filter=None, top_k=10):
+            return []
+
+    with pytest.raises(TypeError):
+        QueryOnly()
+
+
+def test_local_query_ranks_by_cosine(local):
+    matches = local.query([1.0, 0.0], "ns", top_k=2)
+    assert [m.id for m in matches] == ["x", "xy"]
+    assert matches[0].score == pytest.approx(1.0)
+    assert matches[1].score == pytest.approx(2**-0.5)
+    assert matches[0].metadata["attachment_id"] == "a1"
+    assert local.query([1.0, 0.0], "other") == []
+
+
+def test_local_query_applies_filters(local):
+    matches = local.query([1.0, 0.0], "ns", filter={"category": {"$in": ["global_perm"]}})
+    assert [m.id for m in matches] == ["y"]
+    matches = local.query(
+        [1.0, 0.0],
+        "ns",
+        filter={"$or": [{"category": "personal_perm"}, {"attachment_id": {"$in": ["a3"]}}]},
+    )
+    assert [m.id for m in matches] == ["x", "y"]
+
+
+def test_local_upsert_replaces_existing_id(local):
+    local.upsert([_vec("x", [0.0, 1.0], category="global_perm")], "ns")
+    assert [m.id for m in local.query([0.0, 1.0], "ns", top_k=3)][:2] == ["x", "y"]
+    assert local.fetch(["x"], "ns")["x"].metadata == {"category": "global_perm"}
+
+
+def test_local_delete_and_reopen(local, tmp_path):
+    local.delete(["xy", "missing"], "ns")
+    assert [m.id for m in local.query([1.0, 1.0], "ns", top_k=5)] == ["x", "y"]
+    assert set(local.fetch(["x", "xy"], "ns")) == {"x"}
+
+    reopened = LocalVectorStore(root=tmp_path)
+    assert [m.id for m in reopened.query([1.0, 1.0], "ns", top_k=5)] == ["x", "y"]
+
+
+def test_local_compaction_keeps_live_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "LOCAL_COMPACT_MIN_DEAD", 4)
+    store = LocalVectorStore(root=tmp_path)
+    store.upsert([_vec(f"v{i}", [1.0, float(i)], n=i) for i in range(10)], "ns")
+    store.delete([f"v{i}" for i in range(8)], "ns")
+
+    # Compaction rewrote the namespace down to the two live rows
+    assert LocalVectorStore(root=tmp_path)._ns("ns").ids == ["v8", "v9"]
+    for s in (store, LocalVectorStore(root=tmp_path)):
+        matches = s.query([1.0, 9.0], "ns", top_k=5)
+        assert [m.id for m in matches] == ["v9", "v8"]
+        assert matches[0].score == pytest.approx(1.0)
+        assert s.fetch(["v9"], "ns")["v9"].metadata == {"n": 9}
+
+    # Writes after compaction land in the rewritten files
+    store.upsert([_vec("v10", [0.0, 1.0], n=10)], "ns")
+    assert [m.id for m in LocalVectorStore(root=tmp_path).query([0.0, 1.0], "ns")][0] == "v10"